@@ -217,6 +217,8 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
+    'DEFAULT_PAGINATION_CLASS': 'shop.pagination.IdCursorPagination',
+    'PAGE_SIZE': int(os.getenv('API_PAGE_SIZE', 20)),
 }
 
 # JWT settings (optional, but recommended for customization)
@@ -247,6 +249,110 @@ EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
 DEFAULT_FROM_EMAIL = os.getenv('EMAIL_HOST_USER')
 
 
+# Product search retriever
+# Load the DPR encoders and the FAISS index in the background when the app starts
+# instead of on the first search request.
+RETRIEVER_WARM_UP = os.getenv('RETRIEVER_WARM_UP', 'False').lower() == 'true'
+# Products encoded per forward pass, and the token limit texts are truncated to.
+RETRIEVER_BATCH_SIZE = int(os.getenv('RETRIEVER_BATCH_SIZE', 32))
+RETRIEVER_MAX_LENGTH = int(os.getenv('RETRIEVER_MAX_LENGTH', 512))
+# Where `manage.py build_retriever_index` writes index versions, and how often (in seconds)
+# workers check for a newly published one.
+RETRIEVER_INDEX_DIR = Path(os.getenv('RETRIEVER_INDEX_DIR', BASE_DIR / 'retriever_index'))
+RETRIEVER_RELOAD_INTERVAL = int(os.getenv('RETRIEVER_RELOAD_INTERVAL', 30))
+# Index type: 'flat' (exact), or approximate 'ivf_flat', 'ivf_pq' or 'hnsw'. Build-time sizes
+# (nlist 0 = 4 * sqrt(catalog size), PQ sub-quantizers, HNSW links) apply when the index is built,
+# nprobe / efSearch trade recall for latency on every search.
+RETRIEVER_INDEX_TYPE = os.getenv('RETRIEVER_INDEX_TYPE', 'flat')
+RETRIEVER_IVF_NLIST = int(os.getenv('RETRIEVER_IVF_NLIST', 0))
+RETRIEVER_PQ_M = int(os.getenv('RETRIEVER_PQ_M', 64))
+RETRIEVER_HNSW_M = int(os.getenv('RETRIEVER_HNSW_M', 32))
+RETRIEVER_EF_CONSTRUCTION = int(os.getenv('RETRIEVER_EF_CONSTRUCTION', 80))
+RETRIEVER_NPROBE = int(os.getenv('RETRIEVER_NPROBE', 16))
+RETRIEVER_EF_SEARCH = int(os.getenv('RETRIEVER_EF_SEARCH', 64))
+# How indexed vectors are stored: 'float32', 'float16', 'int8' (scalar quantized) or 'pq'
+# (product quantized, RETRIEVER_PQ_M codes per vector). With RETRIEVER_RERANK = N > 0 the index
+# returns N times as many candidates, re-scored exactly against the full-precision vectors kept
+# memory-mapped on disk.
+RETRIEVER_VECTOR_ENCODING = os.getenv('RETRIEVER_VECTOR_ENCODING', 'float32')
+RETRIEVER_RERANK = int(os.getenv('RETRIEVER_RERANK', 0))
+# Per-worker LRU caches of query embeddings and top-k results: entries each, and lifetime in seconds.
+RETRIEVER_CACHE_SIZE = int(os.getenv('RETRIEVER_CACHE_SIZE', 2048))
+RETRIEVER_CACHE_TTL = int(os.getenv('RETRIEVER_CACHE_TTL', 300))
+# Concurrent searches in a worker are encoded and searched together: up to this many per batch,
+# waiting at most this many milliseconds for a batch to fill. Off (1) by default, since a sync
+# worker never has a second search to batch with; raise it for threaded workers. The retriever
+# service batches with RETRIEVER_SERVICE_QUERY_BATCH_SIZE instead.
+RETRIEVER_QUERY_BATCH_SIZE = int(os.getenv('RETRIEVER_QUERY_BATCH_SIZE', 1))
+RETRIEVER_QUERY_BATCH_WAIT_MS = float(os.getenv('RETRIEVER_QUERY_BATCH_WAIT_MS', 2))
+# How often (in seconds) each worker encodes products written since its index was built; 0 disables.
+RETRIEVER_SYNC_INTERVAL = int(os.getenv('RETRIEVER_SYNC_INTERVAL', 5))
+# Run encoding and vector search in one shared process (`manage.py run_retriever_service`)
+# listening on this Unix socket; workers then only send it queries, giving up after the
+# timeout (in seconds) and falling back to a text match. Empty keeps the retriever in process.
+RETRIEVER_SERVICE_SOCKET = os.getenv('RETRIEVER_SERVICE_SOCKET', '')
+RETRIEVER_SERVICE_TIMEOUT = float(os.getenv('RETRIEVER_SERVICE_TIMEOUT', 2))
+# Threads running the service's searches. Requests are handed out one at a time, so any
+# number of connected workers share them.
+RETRIEVER_SERVICE_THREADS = int(os.getenv('RETRIEVER_SERVICE_THREADS', 32))
+RETRIEVER_SERVICE_QUERY_BATCH_SIZE = int(os.getenv('RETRIEVER_SERVICE_QUERY_BATCH_SIZE', 16))
+# Intra-op threads for encoder inference, 0 for the library default (all cores).
+RETRIEVER_TORCH_THREADS = int(os.getenv('RETRIEVER_TORCH_THREADS', 0))
+# Encoder inference backend: 'torch' (full precision), 'quantized' (int8 dynamic quantization)
+# or 'onnx' (ONNX Runtime; the models are exported to RETRIEVER_ONNX_DIR on first use).
+RETRIEVER_ENCODER_BACKEND = os.getenv('RETRIEVER_ENCODER_BACKEND', 'torch')
+RETRIEVER_ONNX_DIR = Path(os.getenv('RETRIEVER_ONNX_DIR', BASE_DIR / 'retriever_onnx'))
+# Filtered searches matching at most this many products scan their vectors exactly instead of
+# searching the index restricted to them.
+RETRIEVER_FILTER_EXACT_LIMIT = int(os.getenv('RETRIEVER_FILTER_EXACT_LIMIT', 10000))
+# Default search mode: 'dense' (DPR vectors only) or 'hybrid' (BM25 over title, description and
+# SKU fused with the dense ranking; a query that is exactly one product's SKU skips the encoder).
+# Hybrid fuses this many candidates from each side with reciprocal rank fusion constant RRF_K.
+# The BM25 index is built at startup only when hybrid is the default; otherwise on the first
+# search asking for hybrid, so dense-only workers never hold it.
+RETRIEVER_SEARCH_MODE = os.getenv('RETRIEVER_SEARCH_MODE', 'dense')
+RETRIEVER_HYBRID_CANDIDATES = int(os.getenv('RETRIEVER_HYBRID_CANDIDATES', 50))
+RETRIEVER_RRF_K = int(os.getenv('RETRIEVER_RRF_K', 60))
+
+# Write-behind counters
+# Product detail views and product clicks are counted in memory by each worker and written to
+# the database as batched increments every this many seconds, and when the worker exits.
+VIEW_COUNT_FLUSH_INTERVAL = float(os.getenv('VIEW_COUNT_FLUSH_INTERVAL', 5))
+CLICK_COUNT_FLUSH_INTERVAL = float(os.getenv('CLICK_COUNT_FLUSH_INTERVAL', 5))
+# Search queries are logged the same way, in inserts of up to SEARCH_LOG_BATCH_SIZE rows written
+# every SEARCH_LOG_FLUSH_INTERVAL seconds or as soon as a batch is full. At most
+# SEARCH_LOG_MAX_PENDING are held per worker; beyond that new entries are dropped and counted.
+SEARCH_LOG_FLUSH_INTERVAL = float(os.getenv('SEARCH_LOG_FLUSH_INTERVAL', 2))
+SEARCH_LOG_BATCH_SIZE = int(os.getenv('SEARCH_LOG_BATCH_SIZE', 500))
+SEARCH_LOG_MAX_PENDING = int(os.getenv('SEARCH_LOG_MAX_PENDING', 10000))
+# Rows each sharded counter (such as site visits) is split over; more shards let more concurrent
+# increments proceed without waiting on one another.
+COUNTER_SHARDS = int(os.getenv('COUNTER_SHARDS', 16))
+
+
+# Cache shared by the workers when REDIS_URL is set; otherwise each worker has its own in memory,
+# and a product change then only invalidates the cached lists of the worker that made it.
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+# Featured product lists are fresh for FEATURED_CACHE_TTL seconds. Once stale, because of age or a
+# product change, they are still served for up to FEATURED_CACHE_MAX_STALE more seconds while one
+# worker rebuilds them, which it is given FEATURED_CACHE_REFRESH_TIMEOUT seconds to do.
+FEATURED_CACHE_TTL = int(os.getenv('FEATURED_CACHE_TTL', 300))
+FEATURED_CACHE_MAX_STALE = int(os.getenv('FEATURED_CACHE_MAX_STALE', 86400))
+FEATURED_CACHE_REFRESH_TIMEOUT = int(os.getenv('FEATURED_CACHE_REFRESH_TIMEOUT', 30))
+
+
 # CELERY_BROKER_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
 # CELERY_RESULT_BACKEND = CELERY_BROKER_URL
 
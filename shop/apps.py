@@ -1,9 +1,14 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ShopConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'shop'
 
-    # def ready(self):
-    #     import shop.signals
+    def ready(self):
+        import shop.signals
+
+        if settings.RETRIEVER_WARM_UP and not settings.RETRIEVER_SERVICE_SOCKET:
+            from .retriever import retriever
+            retriever.warm_up()
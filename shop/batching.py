@@ -0,0 +1,113 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """
+    Collects items submitted from concurrent threads and passes them to
+    ``process`` together, so one call serves many callers.
+
+    A batch is closed when it holds ``max_batch_size`` items or ``max_wait``
+    seconds after its first item arrived. Items that queue up while a batch is
+    being processed go into the next one, so under load batches fill up even
+    with no wait at all. ``process`` receives a list of items and must return
+    one result per item, in order.
+    """
+
+    def __init__(self, process, max_batch_size, max_wait, name='micro-batcher'):
+        self.process = process
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.name = name
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, item, timeout=None):
+        """Queue ``item`` and block until its batch has been processed."""
+        future = Future()
+        self._queue.put((item, future))
+        self._ensure_thread()
+        return future.result(timeout)
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'mean_batch_size': round(self.items / self.batches, 2) if self.batches else None,
+            'largest_batch': self.largest_batch,
+        }
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+
+            self.batches += 1
+            self.items += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+            try:
+                results = self.process([item for item, future in batch])
+            except Exception as e:
+                for item, future in batch:
+                    future.set_exception(e)
+            else:
+                for (item, future), result in zip(batch, results):
+                    future.set_result(result)
+
+
+class SingleFlight:
+    """
+    Runs one computation per key at a time: callers asking for a key that is
+    already being computed wait for that result instead of computing it again.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, compute, timeout=None):
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result(timeout)
+
+        try:
+            result = compute()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def stats(self):
+        return {'calls': self.calls, 'coalesced': self.coalesced, 'in_flight': len(self._in_flight)}
@@ -0,0 +1,35 @@
+"""
+Helpers shared by the benchmark commands: run a call concurrently and
+summarise how long each call took.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+def latency_summary(latencies):
+    latencies = np.asarray(latencies)
+    return {
+        'mean_ms': round(float(latencies.mean()), 3),
+        'p50_ms': round(float(np.percentile(latencies, 50)), 3),
+        'p95_ms': round(float(np.percentile(latencies, 95)), 3),
+        'p99_ms': round(float(np.percentile(latencies, 99)), 3),
+    }
+
+
+def run_concurrently(call, items, threads):
+    """
+    Call ``call`` once per item from ``threads`` threads at a time.
+    Returns ``(results, latencies_ms, calls_per_second)``.
+    """
+    def timed(item):
+        started = time.perf_counter()
+        result = call(item)
+        return result, (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results, latencies = zip(*pool.map(timed, items))
+    elapsed = time.perf_counter() - started
+    return list(results), np.array(latencies), len(items) / elapsed
@@ -0,0 +1,255 @@
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F, Q
+
+from .models import ClickedProduct, CustomUser, Product, SearchQuery
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 500
+
+
+class WriteBehindBuffer:
+    """
+    Holds writes in memory and applies them behind the request path.
+
+    A background thread passes what is pending to ``write`` every ``interval``
+    seconds, or as soon as a subclass asks for it, inside one transaction;
+    ``write`` returns how many items it stored. If a write fails its items are
+    put back for the next one, and whatever is pending is written when the
+    process exits.
+    """
+
+    def __init__(self, write, interval, name):
+        self.write = write
+        self.interval = interval
+        self.name = name
+        self.flushes = 0
+        self.flushed = 0
+        self.failures = 0
+        self.last_flush_seconds = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        atexit.register(self.flush)
+
+    def flush(self):
+        """Write everything pending and return how many items were written."""
+        with self._flush_lock:
+            with self._lock:
+                pending = self._take()
+            if not pending:
+                return 0
+
+            started = time.perf_counter()
+            try:
+                with transaction.atomic():
+                    written = self.write(pending)
+            except Exception:
+                self.failures += 1
+                with self._lock:
+                    self._restore(pending)
+                raise
+
+            self.flushes += 1
+            self.flushed += written
+            self.last_flush_seconds = round(time.perf_counter() - started, 4)
+            return written
+
+    def stats(self):
+        return {
+            'flushes': self.flushes,
+            'flushed': self.flushed,
+            'failures': self.failures,
+            'last_flush_seconds': self.last_flush_seconds,
+        }
+
+    def _take(self):
+        raise NotImplementedError
+
+    def _restore(self, pending):
+        raise NotImplementedError
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Flushing %s failed, retrying in %ss", self.name, self.interval)
+
+
+class CounterBuffer(WriteBehindBuffer):
+    """Sums increments per key; ``write`` receives the ``{key: count}`` totals."""
+
+    def __init__(self, write, interval, name='counter-buffer'):
+        super().__init__(write, interval, name)
+        self._pending = defaultdict(int)
+
+    def add(self, key, count=1):
+        """Count ``count`` more for ``key`` and return how many are pending for it."""
+        with self._lock:
+            self._pending[key] += count
+            pending = self._pending[key]
+        self._ensure_thread()
+        return pending
+
+    def stats(self):
+        with self._lock:
+            pending = sum(self._pending.values())
+            keys = len(self._pending)
+        return {'pending': pending, 'pending_keys': keys, **super().stats()}
+
+    def _take(self):
+        pending, self._pending = dict(self._pending), defaultdict(int)
+        return pending
+
+    def _restore(self, pending):
+        for key, count in pending.items():
+            self._pending[key] += count
+
+
+class EventBuffer(WriteBehindBuffer):
+    """
+    Queues events in order; ``write`` receives a list of them. A flush starts
+    early once ``batch_size`` events are waiting, and at most ``max_pending``
+    are held: beyond that new events are dropped and counted, so memory stays
+    bounded when the database falls behind.
+    """
+
+    def __init__(self, write, interval, batch_size, max_pending, name='event-buffer'):
+        super().__init__(write, interval, name)
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.dropped = 0
+        self._reported_drops = 0
+        self._pending = []
+
+    def add(self, event):
+        """Queue ``event`` and return whether it was accepted."""
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return False
+            self._pending.append(event)
+            full = len(self._pending) >= self.batch_size
+        self._ensure_thread()
+        if full:
+            self._wake.set()
+        return True
+
+    def flush(self):
+        dropped = self.dropped - self._reported_drops
+        if dropped:
+            self._reported_drops += dropped
+            logger.warning("%s was full and dropped %d events since its last flush", self.name, dropped)
+        return super().flush()
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._pending)
+        return {'pending': pending, 'dropped': self.dropped, **super().stats()}
+
+    def _take(self):
+        pending, self._pending = self._pending, []
+        return pending
+
+    def _restore(self, pending):
+        room = max(self.max_pending - len(self._pending), 0)
+        self.dropped += max(len(pending) - room, 0)
+        self._pending[:0] = pending[max(len(pending) - room, 0):]
+
+
+def write_product_views(pending):
+    """Add view counts keyed by product id, one UPDATE per distinct increment, in primary key order."""
+    by_count = defaultdict(list)
+    for pk, count in sorted(pending.items()):
+        by_count[count].append(pk)
+    for count, pks in by_count.items():
+        for start in range(0, len(pks), CHUNK_SIZE):
+            Product.objects.filter(pk__in=pks[start:start + CHUNK_SIZE]).update(views=F('views') + count)
+    return sum(pending.values())
+
+
+def write_product_clicks(pending):
+    """
+    Add click counts keyed by ``(product_id, user_id)`` to their ClickedProduct
+    rows with one bulk update, and bulk create the rows that do not exist yet.
+    Clicks on products that no longer exist are dropped.
+    """
+    products = set(Product.objects.filter(pk__in={product for product, user in pending}).values_list('pk', flat=True))
+    pending = {key: count for key, count in pending.items() if key[0] in products}
+    if not pending:
+        return 0
+
+    try:
+        with transaction.atomic():
+            add_product_clicks(pending, products)
+    except IntegrityError:
+        # Another worker created some of the rows since the lookup; they are found and updated this time
+        add_product_clicks(pending, products)
+    return sum(pending.values())
+
+
+def add_product_clicks(pending, products):
+    users = {user for product, user in pending if user is not None}
+    rows = {}
+    for clicked in (
+        ClickedProduct.objects
+        .filter(Q(product__in=products), Q(user__in=users) | Q(user__isnull=True))
+        .only('id', 'product_id', 'user_id')
+    ):
+        key = (clicked.product_id, clicked.user_id)
+        if key in pending:
+            rows[key] = clicked
+
+    for key, clicked in rows.items():
+        clicked.count = F('count') + pending[key]
+    ClickedProduct.objects.bulk_update(rows.values(), ['count'], batch_size=CHUNK_SIZE)
+    ClickedProduct.objects.bulk_create(
+        [
+            ClickedProduct(product_id=product, user_id=user, count=count)
+            for (product, user), count in pending.items() if (product, user) not in rows
+        ],
+        batch_size=CHUNK_SIZE,
+    )
+
+
+def write_search_queries(events):
+    """Insert ``(user_id, query, timestamp)`` search events; events of deleted users are kept as anonymous."""
+    users = set(CustomUser.objects.filter(pk__in={user for user, query, timestamp in events if user is not None}).values_list('pk', flat=True))
+    SearchQuery.objects.bulk_create(
+        [
+            SearchQuery(user_id=user if user in users else None, query=query, timestamp=timestamp)
+            for user, query, timestamp in events
+        ],
+        batch_size=CHUNK_SIZE,
+    )
+    return len(events)
+
+
+product_views = CounterBuffer(write_product_views, settings.VIEW_COUNT_FLUSH_INTERVAL, name='product-views')
+product_clicks = CounterBuffer(write_product_clicks, settings.CLICK_COUNT_FLUSH_INTERVAL, name='product-clicks')
+search_queries = EventBuffer(
+    write_search_queries,
+    settings.SEARCH_LOG_FLUSH_INTERVAL,
+    batch_size=settings.SEARCH_LOG_BATCH_SIZE,
+    max_pending=settings.SEARCH_LOG_MAX_PENDING,
+    name='search-queries',
+)
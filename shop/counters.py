@@ -0,0 +1,35 @@
+"""
+Sharded counters: a counter is split over several CounterShard rows, each
+increment adds to one of them at random with an atomic UPDATE, and reads sum
+them. Concurrent increments then rarely wait on the same row lock, and none
+are lost to read-modify-write races.
+"""
+import random
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max, Sum
+from django.utils import timezone
+
+from .models import CounterShard
+
+SITE_VISITS = 'site-visits'
+
+
+def increment(name, count=1, shards=None):
+    slot = random.randrange(shards or settings.COUNTER_SHARDS)
+    now = timezone.now()
+    if CounterShard.objects.filter(name=name, slot=slot).update(count=F('count') + count, updated_at=now):
+        return
+    # First increment of this slot; a concurrent one may create it first
+    try:
+        with transaction.atomic():
+            CounterShard.objects.create(name=name, slot=slot, count=count, updated_at=now)
+    except IntegrityError:
+        CounterShard.objects.filter(name=name, slot=slot).update(count=F('count') + count, updated_at=now)
+
+
+def total(name):
+    """``(count, last updated)`` of a counter, summed over its shards."""
+    totals = CounterShard.objects.filter(name=name).aggregate(count=Sum('count'), updated_at=Max('updated_at'))
+    return totals['count'] or 0, totals['updated_at']
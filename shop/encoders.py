@@ -0,0 +1,154 @@
+"""
+CPU inference backends for the DPR encoders, selected with RETRIEVER_ENCODER_BACKEND:
+
+    torch       full-precision PyTorch, the reference
+    quantized   PyTorch with int8 dynamic quantization of the linear layers
+    onnx        the model exported once to ONNX and run with ONNX Runtime
+
+Every backend wraps a tokenizer and a model and turns texts into pooled embeddings.
+"""
+import logging
+import os
+import time
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('torch', 'quantized', 'onnx')
+
+
+class TorchEncoder:
+    tensor_type = 'pt'
+
+    def __init__(self, model_name, model_class, tokenizer_class):
+        self.model_name = model_name
+        self.tokenizer = tokenizer_class.from_pretrained(model_name)
+        self.model = model_class.from_pretrained(model_name)
+        self.model.eval()
+
+    @property
+    def dimension(self):
+        return self.model.config.hidden_size
+
+    @property
+    def max_length(self):
+        return min(settings.RETRIEVER_MAX_LENGTH, self.tokenizer.model_max_length)
+
+    def embed(self, inputs):
+        import torch
+
+        with torch.no_grad():
+            return self.model(**inputs).pooler_output.numpy()
+
+    def encode(self, texts):
+        inputs = self.tokenizer(
+            texts, padding=True, truncation=True, max_length=self.max_length,
+            return_tensors=self.tensor_type,
+        )
+        return self.embed(inputs)
+
+
+class QuantizedTorchEncoder(TorchEncoder):
+    def __init__(self, model_name, model_class, tokenizer_class):
+        import torch
+
+        super().__init__(model_name, model_class, tokenizer_class)
+        self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class OnnxEncoder(TorchEncoder):
+    tensor_type = 'np'
+
+    def __init__(self, model_name, model_class, tokenizer_class):
+        import onnxruntime
+
+        self.model_name = model_name
+        self.tokenizer = tokenizer_class.from_pretrained(model_name)
+        path = settings.RETRIEVER_ONNX_DIR / f"{model_name.replace('/', '--')}.onnx"
+        if not path.exists():
+            export_onnx(model_class.from_pretrained(model_name), path)
+
+        options = onnxruntime.SessionOptions()
+        if settings.RETRIEVER_TORCH_THREADS:
+            options.intra_op_num_threads = settings.RETRIEVER_TORCH_THREADS
+        self.session = onnxruntime.InferenceSession(str(path), options, providers=['CPUExecutionProvider'])
+        self.input_names = [node.name for node in self.session.get_inputs()]
+
+    @property
+    def dimension(self):
+        return self.session.get_outputs()[0].shape[-1]
+
+    def embed(self, inputs):
+        feeds = {name: np.asarray(inputs[name], dtype='int64') for name in self.input_names}
+        return self.session.run(['pooler_output'], feeds)[0]
+
+
+def export_onnx(model, path):
+    """Export a DPR encoder with dynamic batch and sequence axes, atomically."""
+    import torch
+
+    model.eval()
+    model.config.return_dict = False
+    dummy = torch.ones((1, 8), dtype=torch.long)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f'.{os.getpid()}.tmp')
+    dynamic = {0: 'batch', 1: 'sequence'}
+    torch.onnx.export(
+        model,
+        (dummy, dummy, torch.zeros_like(dummy)),
+        str(tmp),
+        input_names=['input_ids', 'attention_mask', 'token_type_ids'],
+        output_names=['pooler_output'],
+        dynamic_axes={'input_ids': dynamic, 'attention_mask': dynamic, 'token_type_ids': dynamic, 'pooler_output': {0: 'batch'}},
+        opset_version=14,
+        dynamo=False,
+    )
+    os.replace(tmp, path)
+    logger.info("Exported %s to %s", model.__class__.__name__, path)
+
+
+def load_encoder(model_name, model_class, tokenizer_class, backend=None):
+    backend = backend or settings.RETRIEVER_ENCODER_BACKEND
+    if backend == 'torch':
+        return TorchEncoder(model_name, model_class, tokenizer_class)
+    if backend == 'quantized':
+        return QuantizedTorchEncoder(model_name, model_class, tokenizer_class)
+    if backend == 'onnx':
+        return OnnxEncoder(model_name, model_class, tokenizer_class)
+    raise ValueError(f"Unknown retriever encoder backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+
+
+def encode_texts(encoder, texts, batch_size, progress=None):
+    """
+    Encode ``texts`` in length-sorted, padded batches truncated to the model limit.
+
+    Embeddings are returned in the order of ``texts``. ``progress`` is called
+    with ``(done, total)`` after every batch. Returns ``(embeddings, items_per_sec)``.
+    """
+    total = len(texts)
+    embeddings = np.zeros((total, encoder.dimension), dtype='float32')
+    if not total:
+        return embeddings, None
+
+    # Tokenize once, then group texts of similar length so batches need little padding
+    encoded = encoder.tokenizer(texts, truncation=True, max_length=encoder.max_length)
+    order = sorted(range(total), key=lambda i: len(encoded['input_ids'][i]))
+
+    started = time.perf_counter()
+    for start in range(0, total, batch_size):
+        batch = order[start:start + batch_size]
+        inputs = encoder.tokenizer.pad(
+            {key: [encoded[key][i] for i in batch] for key in encoded.keys()},
+            return_tensors=encoder.tensor_type,
+        )
+        embeddings[batch] = encoder.embed(inputs)
+
+        done = min(start + batch_size, total)
+        if progress:
+            progress(done, total)
+        logger.debug("Encoded %d/%d texts", done, total)
+
+    elapsed = time.perf_counter() - started
+    return embeddings, round(total / elapsed, 2) if elapsed else None
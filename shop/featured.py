@@ -0,0 +1,98 @@
+"""
+Cached featured product lists for the homepage.
+
+Each list is stored serialized together with the cache version it was built
+at and the time it stops being fresh. Product changes bump the version. A
+request that finds a stale entry, because of either, is answered from it
+while a single worker, holding a short cache lock, rebuilds the list in the
+background; only a request finding no entry at all waits for the database.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from .batching import SingleFlight
+from .models import Product
+from .serializers import ProductSerializer
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'featured-products:version'
+
+FEATURED_LISTS = {
+    'best-sellers': lambda: Product.objects.filter(is_best_seller=True),
+    'new-arrivals': lambda: Product.objects.filter(is_new_arrival=True).order_by('-created_at'),
+    'most-visited': lambda: Product.objects.order_by('-views')[:5],
+}
+
+single_flight = SingleFlight()
+
+
+def entry_key(name):
+    return f'featured-products:{name}'
+
+
+def current_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Start from the clock so a lost version key cannot come back as one already used
+        cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def invalidate():
+    """Mark every cached list stale; they are served until rebuilt."""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        current_version()
+
+
+def featured_products(name):
+    """The serialized products of the featured list ``name``, served from the cache whenever it holds one."""
+    if name not in FEATURED_LISTS:
+        return []
+    values = cache.get_many([VERSION_KEY, entry_key(name)])
+    entry = values.get(entry_key(name))
+    if entry is None:
+        return single_flight.do(name, lambda: build(name))['products']
+
+    if entry['version'] != values.get(VERSION_KEY) or entry['fresh_until'] < time.time():
+        refresh_in_background(name)
+    return entry['products']
+
+
+def build(name):
+    """Query and serialize a featured list and store it under the version current before the query."""
+    version = current_version()
+    products = ProductSerializer.setup_eager_loading(FEATURED_LISTS[name]())
+    entry = {
+        'version': version,
+        'fresh_until': time.time() + settings.FEATURED_CACHE_TTL,
+        'products': list(ProductSerializer(products, many=True).data),
+    }
+    cache.set(entry_key(name), entry, timeout=settings.FEATURED_CACHE_TTL + settings.FEATURED_CACHE_MAX_STALE)
+    return entry
+
+
+def refresh_in_background(name):
+    # Whoever adds the lock rebuilds; everyone else keeps serving the stale list
+    lock = f'{entry_key(name)}:refreshing'
+    if not cache.add(lock, True, timeout=settings.FEATURED_CACHE_REFRESH_TIMEOUT):
+        return
+
+    def refresh():
+        try:
+            build(name)
+        except Exception:
+            logger.exception("Refreshing the featured list %s failed", name)
+        finally:
+            cache.delete(lock)
+            connection.close()
+
+    threading.Thread(target=refresh, name=f'featured-{name}', daemon=True).start()
@@ -0,0 +1,100 @@
+"""
+Recall, latency and memory of approximate or compressed search indexes,
+measured against exact search over full-precision vectors.
+"""
+import time
+
+import numpy as np
+
+from .retriever import INDEX_TYPES, VECTOR_ENCODINGS, build_index, configure_index, exact_rerank, index_memory_bytes
+
+# The search-time parameter swept for each index type
+SWEEPS = {
+    'ivf_flat': ('nprobe', (1, 2, 4, 8, 16, 32, 64, 128)),
+    'ivf_pq': ('nprobe', (1, 2, 4, 8, 16, 32, 64, 128)),
+    'hnsw': ('ef_search', (16, 32, 64, 128, 256)),
+}
+
+
+def sample_queries(embeddings, count, seed=0):
+    """Catalog vectors with a little noise, standing in for queries when none are logged."""
+    rng = np.random.default_rng(seed)
+    picked = embeddings[rng.choice(len(embeddings), size=min(count, len(embeddings)), replace=False)]
+    noise = rng.normal(scale=embeddings.std() * 0.1, size=picked.shape)
+    return (picked + noise).astype('float32')
+
+
+def synthetic_catalog(count, dimension, clusters=100, seed=0):
+    """Clustered random vectors, roughly shaped like encoded product texts."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(min(clusters, count), dimension))
+    assignment = rng.integers(len(centers), size=count)
+    return (centers[assignment] + rng.normal(scale=0.5, size=(count, dimension))).astype('float32')
+
+
+def recall_at_k(reference, candidate):
+    """Mean fraction of the exact top-k that the candidate search also returned."""
+    recalls = []
+    for expected, found in zip(reference, candidate):
+        expected = set(expected.tolist()) - {-1}
+        if expected:
+            recalls.append(len(expected & set(found.tolist())) / len(expected))
+    return float(np.mean(recalls)) if recalls else 1.0
+
+
+def timed_search(index, queries, top_k, rerank=0, vectors=None):
+    """
+    Search one query at a time, like the API does, optionally re-ranking a
+    ``rerank`` times wider shortlist against ``vectors``. Returns ``(ids, latencies_ms)``.
+    """
+    ids = np.full((len(queries), top_k), -1, dtype='int64')
+    latencies = np.empty(len(queries))
+    for row, query in enumerate(queries):
+        started = time.perf_counter()
+        found = index.search(query[None, :], top_k * max(rerank, 1))[1][0]
+        if rerank:
+            found = exact_rerank(vectors, query, found, top_k)[1]
+        latencies[row] = (time.perf_counter() - started) * 1000
+        ids[row, :len(found)] = found[:top_k]
+    return ids, latencies
+
+
+def evaluate(embeddings, queries, top_k, index_types=INDEX_TYPES, encodings=VECTOR_ENCODINGS, rerank=0):
+    """
+    Build every index type / vector encoding combination over ``embeddings`` and
+    report its size, recall@k against the flat float32 index and per-query latency
+    for every point of its parameter sweep. Compressed encodings are also measured
+    with a ``rerank`` times wider shortlist re-scored exactly, when ``rerank`` is set.
+    """
+    reference = build_index(embeddings, 'flat', 'float32').search(queries, top_k)[1]
+    rows = []
+    for index_type in index_types:
+        # IVF-PQ always stores PQ codes
+        for encoding in ('pq',) if index_type == 'ivf_pq' else encodings:
+            started = time.perf_counter()
+            index = build_index(embeddings, index_type, encoding)
+            build_seconds = time.perf_counter() - started
+            memory_mb = index_memory_bytes(index) / 2 ** 20
+
+            name, values = SWEEPS.get(index_type, (None, (None,)))
+            rerank_factors = (0, rerank) if rerank and encoding != 'float32' else (0,)
+            for value in values:
+                if name == 'nprobe' and value > getattr(index, 'nlist', value):
+                    continue
+                if name:
+                    configure_index(index, **{name: value})
+                for factor in rerank_factors:
+                    ids, latencies = timed_search(index, queries, top_k, factor, embeddings)
+                    rows.append({
+                        'index_type': index_type,
+                        'encoding': encoding,
+                        'parameter': name,
+                        'value': value,
+                        'rerank': factor,
+                        'recall': round(recall_at_k(reference, ids), 4),
+                        'mean_ms': round(float(latencies.mean()), 3),
+                        'p95_ms': round(float(np.percentile(latencies, 95)), 3),
+                        'memory_mb': round(memory_mb, 2),
+                        'build_seconds': round(build_seconds, 2),
+                    })
+    return rows
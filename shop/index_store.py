@@ -0,0 +1,131 @@
+"""
+Versioned on-disk artifacts for the product search index.
+
+Layout under settings.RETRIEVER_INDEX_DIR:
+
+    CURRENT             name of the version workers should serve
+    <version>/          index.faiss, ids.npy (index position -> primary key),
+                        embeddings.npy (full-precision vectors by position),
+                        hashes.npy (content hash of the text behind each vector), meta.json
+
+A version directory is written under a temporary name and renamed into place,
+and CURRENT is replaced atomically, so readers never see a half-written index.
+"""
+import json
+import os
+import shutil
+from datetime import datetime, timezone
+
+import numpy as np
+from django.conf import settings
+
+INDEX_FILE = 'index.faiss'
+IDS_FILE = 'ids.npy'
+EMBEDDINGS_FILE = 'embeddings.npy'
+HASHES_FILE = 'hashes.npy'
+META_FILE = 'meta.json'
+CURRENT_FILE = 'CURRENT'
+
+
+def index_root():
+    return settings.RETRIEVER_INDEX_DIR
+
+
+def list_versions():
+    root = index_root()
+    if not root.is_dir():
+        return []
+    return sorted(path.name for path in root.iterdir() if path.is_dir() and not path.name.startswith('.'))
+
+
+def current_version():
+    try:
+        return (index_root() / CURRENT_FILE).read_text().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def save(index, ids, embeddings=None, hashes=None, **meta):
+    """Write a new version and make it current. Returns the version name."""
+    import faiss
+
+    root = index_root()
+    root.mkdir(parents=True, exist_ok=True)
+    version = datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S%f')
+
+    staging = root / f'.{version}.tmp'
+    staging.mkdir()
+    faiss.write_index(index, str(staging / INDEX_FILE))
+    np.save(staging / IDS_FILE, np.asarray(ids, dtype='int64'))
+    if embeddings is not None:
+        np.save(staging / EMBEDDINGS_FILE, np.asarray(embeddings, dtype='float32'))
+        if hashes is not None:
+            np.save(staging / HASHES_FILE, np.asarray(hashes, dtype='int64'))
+    meta.update(
+        version=version,
+        count=int(index.ntotal),
+        dimension=int(index.d),
+        index_bytes=(staging / INDEX_FILE).stat().st_size,
+    )
+    (staging / META_FILE).write_text(json.dumps(meta, indent=2))
+    os.rename(staging, root / version)
+
+    publish(version)
+    return version
+
+
+def publish(version):
+    """Point CURRENT at ``version``; running workers pick it up on their next reload check."""
+    root = index_root()
+    if not (root / version).is_dir():
+        raise FileNotFoundError(f"Index version {version} does not exist in {root}")
+    tmp = root / f'.{CURRENT_FILE}.{os.getpid()}.tmp'
+    tmp.write_text(version)
+    os.replace(tmp, root / CURRENT_FILE)
+
+
+def load(version):
+    """
+    Load a version memory-mapped, so every worker on the host shares the same pages.
+
+    Returns ``(index, ids, embeddings, meta)``; embeddings is None for versions
+    written without them.
+    """
+    import faiss
+
+    path = index_root() / version
+    meta = json.loads((path / META_FILE).read_text())
+    factory = meta.get('factory')
+    if factory is None or 'IVF' in factory:
+        # Only the inverted lists can be mapped; IVF does not load with the in-place flags
+        flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    else:
+        # Flat, HNSW, SQ and PQ codes are used in place from the mapped file instead of copied
+        flags = faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+    index = faiss.read_index(str(path / INDEX_FILE), flags)
+    ids = np.load(path / IDS_FILE, mmap_mode='r')
+    embeddings = np.load(path / EMBEDDINGS_FILE, mmap_mode='r') if (path / EMBEDDINGS_FILE).exists() else None
+    return index, ids, embeddings, meta
+
+
+def load_embeddings(version):
+    """
+    The ``(hashes, embeddings)`` stored with a version, memory-mapped, or None
+    when it was written without them.
+    """
+    path = index_root() / version
+    if not (path / HASHES_FILE).exists() or not (path / EMBEDDINGS_FILE).exists():
+        return None
+    return np.load(path / HASHES_FILE, mmap_mode='r'), np.load(path / EMBEDDINGS_FILE, mmap_mode='r')
+
+
+def prune(keep):
+    """Delete all but the newest ``keep`` versions, never touching the current one."""
+    current = current_version()
+    versions = list_versions()
+    removed = []
+    for version in versions[:max(len(versions) - keep, 0)]:
+        if version != current:
+            shutil.rmtree(index_root() / version)
+            removed.append(version)
+    return removed
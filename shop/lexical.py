@@ -0,0 +1,110 @@
+import heapq
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(unicodedata.normalize('NFKC', text).lower())
+
+
+def normalize_sku(sku):
+    return ''.join(tokenize(sku))
+
+
+class BM25Index:
+    """
+    An in-memory inverted index scoring documents with Okapi BM25, plus an exact
+    SKU lookup. Documents are keyed by primary key and can be added, replaced and
+    removed one at a time, so the index follows the catalog without rebuilds.
+    """
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        # term -> {pk: term frequency}
+        self.postings = {}
+        self.doc_terms = {}
+        self.doc_lengths = {}
+        self.total_length = 0
+        # normalized sku -> pks
+        self.skus = {}
+        self.doc_skus = {}
+
+    def __len__(self):
+        return len(self.doc_terms)
+
+    def add(self, pk, text, skus=()):
+        terms = Counter(tokenize(text))
+        for sku in skus:
+            terms[normalize_sku(sku)] += 1
+        skus = {normalize_sku(sku) for sku in skus}
+        with self._lock:
+            self._remove(pk)
+            for term, count in terms.items():
+                self.postings.setdefault(term, {})[pk] = count
+            self.doc_terms[pk] = terms
+            self.doc_lengths[pk] = sum(terms.values())
+            self.total_length += self.doc_lengths[pk]
+            for sku in skus:
+                self.skus.setdefault(sku, set()).add(pk)
+            self.doc_skus[pk] = skus
+
+    def remove(self, pk):
+        with self._lock:
+            self._remove(pk)
+
+    def _remove(self, pk):
+        terms = self.doc_terms.pop(pk, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self.postings[term]
+            del postings[pk]
+            if not postings:
+                del self.postings[term]
+        self.total_length -= self.doc_lengths.pop(pk)
+        for sku in self.doc_skus.pop(pk):
+            pks = self.skus[sku]
+            pks.discard(pk)
+            if not pks:
+                del self.skus[sku]
+
+    def sku_matches(self, query):
+        """Primary keys whose SKU equals the whole query, ignoring case and punctuation."""
+        return set(self.skus.get(normalize_sku(query), ()))
+
+    def search(self, query, top_k, accept=None):
+        """The ``top_k`` best ``(score, pk)`` pairs, best first, among pks for which ``accept`` is true."""
+        scores = {}
+        with self._lock:
+            count = len(self.doc_terms)
+            if not count:
+                return []
+            average_length = self.total_length / count
+            for term in set(tokenize(query)):
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for pk, frequency in postings.items():
+                    norm = frequency + self.k1 * (1 - self.b + self.b * self.doc_lengths[pk] / average_length)
+                    scores[pk] = scores.get(pk, 0) + idf * frequency * (self.k1 + 1) / norm
+        return heapq.nlargest(top_k, ((score, pk) for pk, score in scores.items() if accept is None or accept(pk)))
+
+    def stats(self):
+        return {'documents': len(self.doc_terms), 'terms': len(self.postings), 'skus': len(self.skus)}
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Merge ranked lists of primary keys, scoring each by the sum of 1 / (k + rank)."""
+    scores = {}
+    for ranking in rankings:
+        for rank, pk in enumerate(ranking, start=1):
+            scores[pk] = scores.get(pk, 0) + 1 / (k + rank)
+    return sorted(scores, key=lambda pk: -scores[pk])
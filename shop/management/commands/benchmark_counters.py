@@ -0,0 +1,104 @@
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Sum
+from django.test import RequestFactory
+from rest_framework.test import force_authenticate
+from shop.benchmarking import latency_summary, run_concurrently
+from shop.buffers import product_clicks, product_views, search_queries
+from shop.models import ClickedProduct, Product, SearchQuery
+from shop.views import ClickedProductView, ProductDetailView, SearchQueryView
+
+User = get_user_model()
+
+
+def view_requests(factory, product, user):
+    return ProductDetailView.as_view(), factory.get(f'/api/products/{product.pk}/'), {'pk': product.pk}
+
+
+def click_requests(factory, product, user):
+    return ClickedProductView.as_view(), factory.post('/api/clicked-products/', {'product_id': product.pk}), {}
+
+
+def search_requests(factory, product, user):
+    request = factory.post('/api/search-query/', {'query': product.title})
+    force_authenticate(request, user)
+    return SearchQueryView.as_view(), request, {}
+
+
+# counter -> (buffer, request about one product, total recorded for the products and user)
+COUNTERS = {
+    'views': (
+        product_views,
+        view_requests,
+        lambda products, user: Product.objects.filter(pk__in=products).aggregate(total=Sum('views'))['total'] or 0,
+    ),
+    'clicks': (
+        product_clicks,
+        click_requests,
+        lambda products, user: ClickedProduct.objects.filter(product__in=products).aggregate(total=Sum('count'))['total'] or 0,
+    ),
+    'searches': (
+        search_queries,
+        search_requests,
+        lambda products, user: SearchQuery.objects.filter(user=user).count(),
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = 'Measure request throughput and flush rate of the write-behind counters and search log, and check nothing is lost'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--counters', default=','.join(COUNTERS), help='Comma-separated counters to measure')
+        parser.add_argument('--requests', type=int, default=5000, help='Requests per measurement')
+        parser.add_argument('--threads', default='1,8', help='Comma-separated numbers of concurrent request threads')
+        parser.add_argument('--products', type=int, default=100, help='Number of products the requests are spread over')
+
+    def handle(self, *args, **options):
+        counters = options['counters'].split(',')
+        if set(counters) - set(COUNTERS):
+            raise CommandError(f"Unknown counters, expected some of {', '.join(COUNTERS)}")
+
+        # A throwaway vendor and products, deleted with everything recorded for them at the end
+        tag = uuid.uuid4().hex[:8]
+        vendor = User.objects.create(username=f'benchmark-{tag}', email=f'benchmark-{tag}@example.com', role='vendor')
+        try:
+            products = Product.objects.bulk_create([
+                Product(vendor=vendor, title=f'Benchmark {i}', description='', price=1, sku=f'benchmark-{tag}-{i}')
+                for i in range(options['products'])
+            ])
+            self.stdout.write(
+                f"{'counter':<10}{'threads':>8}{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+                f"{'flush s':>9}{'writes/s':>10}{'lost':>6}"
+            )
+            for counter in counters:
+                for threads in (int(value) for value in options['threads'].split(',')):
+                    self.measure(counter, products, vendor, options['requests'], threads)
+        finally:
+            vendor.delete()
+
+    def measure(self, counter, products, user, requests, threads):
+        buffer, build, total = COUNTERS[counter]
+        factory = RequestFactory()
+        pks = [product.pk for product in products]
+        buffer.flush()
+        before = total(pks, user)
+
+        def call(i):
+            view, request, kwargs = build(factory, products[i % len(products)], user)
+            return view(request, **kwargs).status_code
+
+        statuses, latencies, rate = run_concurrently(call, range(requests), threads)
+        if any(code >= 400 for code in statuses):
+            raise CommandError(f"{counter} requests failed with status {max(statuses)}")
+
+        written = buffer.flush()
+        seconds = buffer.last_flush_seconds if written else None
+        lost = requests - (total(pks, user) - before)
+        summary = latency_summary(latencies)
+        self.stdout.write(
+            f"{counter:<10}{threads:>8}{rate:>10.1f}{summary['p50_ms']:>9.3f}{summary['p95_ms']:>9.3f}{summary['p99_ms']:>9.3f}"
+            f"{seconds or 0:>9.3f}{written / seconds if seconds else 0:>10.0f}{lost:>6}"
+        )
@@ -0,0 +1,173 @@
+import json
+import platform
+import time
+
+import faiss
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from shop import index_store
+from shop.benchmarking import latency_summary, run_concurrently
+from shop.index_evaluation import recall_at_k, sample_queries, synthetic_catalog
+from shop.retriever import INDEX_TYPES, VECTOR_ENCODINGS, IndexOverlay, IndexSnapshot, Retriever, build_index, index_memory_bytes
+
+
+class Command(BaseCommand):
+    help = 'Benchmark index build time, memory, search latency, throughput and recall@k of the product retriever'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=10000, help='Size of the synthetic catalog')
+        parser.add_argument('--dimension', type=int, default=768, help='Vector dimension of the synthetic catalog')
+        parser.add_argument('--catalog', default=None, help="A .npy file of catalog vectors, or 'current' for the published index version")
+        parser.add_argument('--queries', type=int, default=500, help='Number of queries per measurement')
+        parser.add_argument('--top-k', type=int, default=10)
+        parser.add_argument('--index-types', default=settings.RETRIEVER_INDEX_TYPE, help='Comma-separated index types')
+        parser.add_argument('--encodings', default=settings.RETRIEVER_VECTOR_ENCODING, help='Comma-separated vector encodings')
+        parser.add_argument('--concurrency', default='1,4,16', help='Comma-separated numbers of concurrent searching threads')
+        parser.add_argument('--selectivity', default='1,0.01', help='Comma-separated fractions of the catalog a filter allows, 1 for unfiltered')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default=None, help='Write the results as JSON to this file')
+        parser.add_argument('--compare', default=None, help='A previous --output file to report changes against')
+
+    def handle(self, *args, **options):
+        embeddings = self.catalog(options)
+        queries = sample_queries(embeddings, options['queries'], seed=options['seed'])
+        top_k = min(options['top_k'], len(embeddings))
+        ids = np.arange(len(embeddings), dtype='int64')
+        rng = np.random.default_rng(options['seed'])
+        concurrency = [int(threads) for threads in options['concurrency'].split(',')]
+
+        # Each filter is an allowed id set, with exact search restricted to it as the reference
+        filters = {}
+        for selectivity in (float(value) for value in options['selectivity'].split(',')):
+            allowed = None
+            if selectivity < 1:
+                allowed = np.sort(rng.choice(ids, size=max(1, int(len(ids) * selectivity)), replace=False))
+            filters[selectivity] = (allowed, exact_top_k(embeddings, queries, top_k, allowed))
+
+        results = []
+        for index_type in options['index_types'].split(','):
+            for encoding in ('pq',) if index_type == 'ivf_pq' else options['encodings'].split(','):
+                if index_type not in INDEX_TYPES or encoding not in VECTOR_ENCODINGS:
+                    raise CommandError(f"Unknown index type or encoding {index_type}/{encoding}")
+                self.stdout.write(f"Building {index_type}/{encoding} over {len(embeddings)} vectors...")
+                results.append(self.measure(index_type, encoding, embeddings, ids, queries, top_k, filters, concurrency))
+
+        report = {
+            'created_at': timezone.now().isoformat(),
+            'config': {
+                key: options[key] for key in ('products', 'dimension', 'catalog', 'queries', 'top_k', 'seed')
+            } | {
+                'vectors': len(embeddings),
+                'dimension': int(embeddings.shape[1]),
+                'rerank': settings.RETRIEVER_RERANK,
+                'nprobe': settings.RETRIEVER_NPROBE,
+                'ef_search': settings.RETRIEVER_EF_SEARCH,
+                'filter_exact_limit': settings.RETRIEVER_FILTER_EXACT_LIMIT,
+            },
+            'environment': {
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'faiss': faiss.__version__,
+                'numpy': np.__version__,
+                'faiss_threads': faiss.omp_get_max_threads(),
+            },
+            'results': results,
+        }
+        self.report(results, top_k)
+        if options['compare']:
+            with open(options['compare']) as f:
+                self.compare(json.load(f)['results'], results)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def catalog(self, options):
+        if options['catalog'] == 'current':
+            version = index_store.current_version()
+            stored = index_store.load_embeddings(version) if version else None
+            if stored is None:
+                raise CommandError('The current index version has no stored embeddings to benchmark with.')
+            return np.array(stored[1], dtype='float32')
+        if options['catalog']:
+            return np.load(options['catalog']).astype('float32')
+        return synthetic_catalog(options['products'], options['dimension'], seed=options['seed'])
+
+    def measure(self, index_type, encoding, embeddings, ids, queries, top_k, filters, concurrency):
+        """Build one index and search it through the retriever at every filter and concurrency level."""
+        started = time.perf_counter()
+        index = build_index(embeddings, index_type, encoding)
+        build_seconds = time.perf_counter() - started
+
+        # Like a published version: the full-precision vectors sit next to the index
+        retriever = Retriever()
+        retriever.snapshot = IndexSnapshot(index, ids, embeddings=embeddings)
+        retriever.overlay = IndexOverlay(embeddings.shape[1])
+
+        runs = []
+        for selectivity, (allowed, reference) in filters.items():
+            for threads in concurrency:
+                found, latencies, qps = run_concurrently(
+                    lambda query: retriever.search_embeddings(query[None, :], top_k, allowed, key=selectivity)[1][0],
+                    queries,
+                    threads,
+                )
+                runs.append({
+                    'selectivity': selectivity,
+                    'threads': threads,
+                    'qps': round(qps, 1),
+                    'recall': round(recall_at_k(reference, np.array(found)), 4),
+                    **latency_summary(latencies),
+                })
+        return {
+            'index_type': index_type,
+            'encoding': encoding,
+            'build_seconds': round(build_seconds, 3),
+            'memory_mb': round(index_memory_bytes(index) / 2 ** 20, 2),
+            'runs': runs,
+        }
+
+    def report(self, results, top_k):
+        self.stdout.write(
+            f"{'index':<10}{'encoding':<10}{'filter':>8}{'threads':>8}{'qps':>10}{f'recall@{top_k}':>11}"
+            f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'MB':>9}{'build s':>9}"
+        )
+        for result in results:
+            for run in result['runs']:
+                self.stdout.write(
+                    f"{result['index_type']:<10}{result['encoding']:<10}{run['selectivity']:>8g}{run['threads']:>8}"
+                    f"{run['qps']:>10.1f}{run['recall']:>11.4f}{run['p50_ms']:>9.3f}{run['p95_ms']:>9.3f}"
+                    f"{run['p99_ms']:>9.3f}{result['memory_mb']:>9.2f}{result['build_seconds']:>9.2f}"
+                )
+
+    def compare(self, previous, results):
+        """Print the change in throughput, p95 and recall for every run present in both result sets."""
+        baseline = {
+            (result['index_type'], result['encoding'], run['selectivity'], run['threads']): run
+            for result in previous for run in result['runs']
+        }
+        self.stdout.write('Change against the previous results:')
+        for result in results:
+            for run in result['runs']:
+                key = (result['index_type'], result['encoding'], run['selectivity'], run['threads'])
+                before = baseline.get(key)
+                if before:
+                    self.stdout.write(
+                        f"{key[0]:<10}{key[1]:<10}{key[2]:>8g}{key[3]:>8}"
+                        f"{relative(run['qps'], before['qps']):>10}{run['recall'] - before['recall']:>+11.4f}"
+                        f"{relative(run['p95_ms'], before['p95_ms']):>9}"
+                    )
+
+
+def exact_top_k(embeddings, queries, top_k, allowed=None):
+    """Ids of the exact nearest neighbours, among ``allowed`` when given."""
+    if allowed is None:
+        return faiss.knn(queries, embeddings, top_k)[1]
+    found = faiss.knn(queries, embeddings[allowed], min(top_k, len(allowed)))[1]
+    return allowed[found]
+
+
+def relative(value, before):
+    return f"{(value - before) / before:+.1%}" if before else '-'
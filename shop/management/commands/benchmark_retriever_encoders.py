@@ -0,0 +1,85 @@
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from shop.encoders import BACKENDS, encode_texts, load_encoder
+from shop.index_evaluation import recall_at_k
+from shop.models import Product, SearchQuery
+from shop.retriever import CONTEXT_ENCODER_NAME, QUESTION_ENCODER_NAME, build_index
+
+
+class Command(BaseCommand):
+    help = 'Compare encoder backends on query latency, batch throughput and agreement with full-precision torch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backends', default=','.join(BACKENDS), help='Comma-separated backends to compare')
+        parser.add_argument('--products', type=int, default=500, help='Number of catalog products to encode')
+        parser.add_argument('--queries', type=int, default=100, help='Number of queries to encode one at a time')
+        parser.add_argument('--batch-size', type=int, default=None, help='Defaults to RETRIEVER_BATCH_SIZE')
+        parser.add_argument('--top-k', type=int, default=10, help='k for the ranking agreement')
+
+    def handle(self, *args, **options):
+        from transformers import DPRContextEncoder, DPRContextEncoderTokenizerFast, DPRQuestionEncoder, DPRQuestionEncoderTokenizerFast
+
+        batch_size = options['batch_size'] or settings.RETRIEVER_BATCH_SIZE
+        texts = [
+            f"{title} {description}"
+            for title, description in Product.objects.values_list('title', 'description')[:options['products']]
+        ]
+        # Logged searches, or the first words of product texts when nothing is logged yet
+        queries = [
+            query for query in SearchQuery.objects.values_list('query', flat=True).distinct()[:options['queries']]
+            if query
+        ] or [' '.join(text.split()[:3]) for text in texts[:options['queries']]]
+        if not texts or not queries:
+            self.stdout.write(self.style.ERROR('Need at least one product to benchmark with.'))
+            return
+
+        # torch is the reference every other backend is compared against
+        backends = ['torch'] + [backend for backend in options['backends'].split(',') if backend != 'torch']
+        results = {}
+        for backend in backends:
+            self.stdout.write(f"Loading {backend} encoders...")
+            context = load_encoder(CONTEXT_ENCODER_NAME, DPRContextEncoder, DPRContextEncoderTokenizerFast, backend)
+            question = load_encoder(QUESTION_ENCODER_NAME, DPRQuestionEncoder, DPRQuestionEncoderTokenizerFast, backend)
+            question.encode(queries[:1])
+
+            latencies = []
+            query_embeddings = []
+            for query in queries:
+                started = time.perf_counter()
+                query_embeddings.append(question.encode([query])[0])
+                latencies.append((time.perf_counter() - started) * 1000)
+            product_embeddings, items_per_sec = encode_texts(context, texts, batch_size)
+            results[backend] = {
+                'queries': np.array(query_embeddings, dtype='float32'),
+                'products': product_embeddings,
+                'p50_ms': float(np.percentile(latencies, 50)),
+                'p95_ms': float(np.percentile(latencies, 95)),
+                'items_per_sec': items_per_sec,
+            }
+
+        reference = results['torch']
+        top_k = min(options['top_k'], len(texts))
+        reference_ranking = build_index(reference['products'], 'flat', 'float32').search(reference['queries'], top_k)[1]
+
+        self.stdout.write(
+            f"{'backend':<11}{'query p50 ms':>14}{'query p95 ms':>14}{'items/sec':>11}"
+            f"{'cos products':>14}{'cos queries':>13}{f'rank@{top_k}':>9}"
+        )
+        for backend, result in results.items():
+            ranking = build_index(result['products'], 'flat', 'float32').search(result['queries'], top_k)[1]
+            self.stdout.write(
+                f"{backend:<11}{result['p50_ms']:>14.2f}{result['p95_ms']:>14.2f}{result['items_per_sec']:>11.2f}"
+                f"{cosine(result['products'], reference['products']):>14.4f}"
+                f"{cosine(result['queries'], reference['queries']):>13.4f}"
+                f"{recall_at_k(reference_ranking, ranking):>9.4f}"
+            )
+
+
+def cosine(embeddings, reference):
+    """Mean cosine similarity between matching rows."""
+    dot = (embeddings * reference).sum(axis=1)
+    norms = np.linalg.norm(embeddings, axis=1) * np.linalg.norm(reference, axis=1)
+    return float(np.mean(dot / np.maximum(norms, 1e-12)))
@@ -0,0 +1,81 @@
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from shop import counters
+from shop.benchmarking import latency_summary, run_concurrently
+from shop.models import CounterShard, Visit
+
+
+def single_row(visit_id):
+    """The previous visit counter: read the one row, add one, save it."""
+    def increment():
+        visit, created = Visit.objects.get_or_create(id=visit_id)
+        visit.count += 1
+        visit.save()
+
+    def total():
+        return Visit.objects.get(id=visit_id).count
+
+    def cleanup():
+        Visit.objects.filter(id=visit_id).delete()
+
+    return increment, total, cleanup
+
+
+def sharded(name, shards):
+    def increment():
+        counters.increment(name, shards=shards)
+
+    def total():
+        return counters.total(name)[0]
+
+    def cleanup():
+        CounterShard.objects.filter(name=name).delete()
+
+    return increment, total, cleanup
+
+
+class Command(BaseCommand):
+    help = 'Compare throughput and lost increments of the single-row and sharded visit counters under concurrent load'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--increments', type=int, default=2000, help='Increments per measurement')
+        parser.add_argument('--threads', default='1,8,32', help='Comma-separated numbers of concurrent threads')
+        parser.add_argument('--shards', default=str(settings.COUNTER_SHARDS), help='Comma-separated shard counts to measure')
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'counter':<14}{'threads':>8}{'incr/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'lost':>7}{'errors':>8}"
+        )
+        for threads in (int(value) for value in options['threads'].split(',')):
+            # Throwaway counters, so the site visit count is left alone
+            visit = Visit.objects.create()
+            self.measure('single row', single_row(visit.id), options['increments'], threads)
+            for shards in (int(value) for value in options['shards'].split(',')):
+                if shards < 1:
+                    raise CommandError('Shard counts must be at least 1')
+                name = f'benchmark-{uuid.uuid4().hex[:8]}'
+                self.measure(f'{shards} shards', sharded(name, shards), options['increments'], threads)
+
+    def measure(self, label, counter, increments, threads):
+        increment, total, cleanup = counter
+
+        def call(i):
+            try:
+                increment()
+            except Exception:
+                return False
+            return True
+
+        try:
+            succeeded, latencies, rate = run_concurrently(call, range(increments), threads)
+            errors = increments - sum(succeeded)
+            lost = increments - errors - total()
+        finally:
+            cleanup()
+        summary = latency_summary(latencies)
+        self.stdout.write(
+            f"{label:<14}{threads:>8}{rate:>10.1f}{summary['p50_ms']:>9.3f}{summary['p95_ms']:>9.3f}{summary['p99_ms']:>9.3f}"
+            f"{lost:>7}{errors:>8}"
+        )
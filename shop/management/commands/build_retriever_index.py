@@ -0,0 +1,98 @@
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from shop import index_store
+from shop.index_evaluation import evaluate, sample_queries
+from shop.models import Product, ProductDeletion, SearchQuery
+from shop.retriever import INDEX_SOURCE, INDEX_TYPES, SYNC_SLACK, VECTOR_ENCODINGS, build_index, index_factory_string, retriever
+
+
+class Command(BaseCommand):
+    help = 'Encode the product catalog and publish a new version of the search index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Products per encoder forward pass')
+        parser.add_argument('--keep', type=int, default=3, help='Number of index versions to keep on disk')
+        parser.add_argument('--index-type', choices=INDEX_TYPES, default=None, help='Defaults to RETRIEVER_INDEX_TYPE')
+        parser.add_argument('--encoding', choices=VECTOR_ENCODINGS, default=None, help='Defaults to RETRIEVER_VECTOR_ENCODING')
+        parser.add_argument('--evaluate', action='store_true', help='Report size, recall@k and latency of each index type and encoding against exact search')
+        parser.add_argument('--eval-index-types', default=','.join(INDEX_TYPES), help='Comma-separated index types for --evaluate')
+        parser.add_argument('--eval-encodings', default=','.join(VECTOR_ENCODINGS), help='Comma-separated vector encodings for --evaluate')
+        parser.add_argument('--eval-rerank', type=int, default=4, help='Shortlist factor for exact re-ranking in --evaluate, 0 to skip')
+        parser.add_argument('--eval-queries', type=int, default=200, help='Number of queries used by --evaluate')
+        parser.add_argument('--eval-k', type=int, default=10, help='k used for recall@k by --evaluate')
+
+    def handle(self, *args, **options):
+        index_type = options['index_type'] or settings.RETRIEVER_INDEX_TYPE
+        encoding = options['encoding'] or settings.RETRIEVER_VECTOR_ENCODING
+        retriever.load_encoders()
+
+        built_at = timezone.now()
+        products = list(Product.objects.order_by('pk').only('id', 'title', 'description'))
+        ids = np.array([product.pk for product in products], dtype='int64')
+        embeddings, hashes = retriever.encode_catalog(products, batch_size=options['batch_size'], progress=self.progress)
+
+        evaluation = None
+        if options['evaluate'] and len(products):
+            evaluation = evaluate(
+                embeddings,
+                self.evaluation_queries(embeddings, options['eval_queries']),
+                options['eval_k'],
+                index_types=options['eval_index_types'].split(','),
+                encodings=options['eval_encodings'].split(','),
+                rerank=options['eval_rerank'],
+            )
+            self.report(evaluation, options['eval_k'])
+
+        version = index_store.save(
+            build_index(embeddings, index_type, encoding),
+            ids,
+            embeddings=embeddings,
+            hashes=hashes,
+            source=INDEX_SOURCE,
+            built_at=built_at.isoformat(),
+            index_type=index_type,
+            encoding=encoding,
+            factory=index_factory_string(index_type, *embeddings.shape, encoding),
+            encoder=retriever.encoder_key,
+            encode_items_per_sec=retriever.stats.get('encode_items_per_sec'),
+            reused_embeddings=retriever.stats.get('reused_embeddings'),
+            evaluation=evaluation,
+        )
+        removed = index_store.prune(options['keep'])
+        # Workers load this version or a newer one from now on, so earlier deletions are in every index served
+        ProductDeletion.objects.filter(deleted_at__lt=built_at - SYNC_SLACK).delete()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Published {index_type}/{encoding} index version {version} with {len(ids)} products "
+            f"({retriever.stats.get('reused_embeddings')} reused, {retriever.stats.get('encode_items_per_sec')} items/sec)"
+        ))
+        if removed:
+            self.stdout.write(f"Removed old versions: {', '.join(removed)}")
+
+    def progress(self, done, total):
+        self.stdout.write(f"Encoded {done}/{total} products", ending='\r' if done < total else '\n')
+
+    def evaluation_queries(self, embeddings, count):
+        # Prefer what users actually searched for, topped up with perturbed catalog vectors
+        logged = list(
+            SearchQuery.objects.order_by('-timestamp').values_list('query', flat=True).distinct()[:count]
+        )
+        queries = [retriever.encode_query(query)[0] for query in logged if query]
+        if len(queries) < count:
+            queries.extend(sample_queries(embeddings, count - len(queries)))
+        return np.array(queries, dtype='float32')
+
+    def report(self, rows, top_k):
+        self.stdout.write(
+            f"{'index':<10}{'encoding':<10}{'parameter':<16}{'rerank':>7}{f'recall@{top_k}':>11}"
+            f"{'mean ms':>9}{'p95 ms':>9}{'MB':>9}{'build s':>9}"
+        )
+        for row in rows:
+            parameter = f"{row['parameter']}={row['value']}" if row['parameter'] else '-'
+            self.stdout.write(
+                f"{row['index_type']:<10}{row['encoding']:<10}{parameter:<16}{row['rerank'] or '-':>7}"
+                f"{row['recall']:>11.4f}{row['mean_ms']:>9.3f}{row['p95_ms']:>9.3f}"
+                f"{row['memory_mb']:>9.2f}{row['build_seconds']:>9.2f}"
+            )
@@ -0,0 +1,131 @@
+import random
+import uuid
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+from shop.models import Category, Order, OrderItem, Product, SearchQuery, VendorRequest
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Show the query plans of the hot product, order and analytics filters and check they use their indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help='Insert this many synthetic products, with orders and search logs, and roll them back afterwards')
+        parser.add_argument('--analyze', action='store_true', help='Run the queries and report actual timings (PostgreSQL only)')
+        parser.add_argument('--verbose-plans', action='store_true', help='Print every plan, not only the ones missing their index')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options['seed']:
+                self.stdout.write(f"Seeding {options['seed']} products...")
+                seed(options['seed'])
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+            self.explain(options)
+            transaction.set_rollback(True)
+
+    def explain(self, options):
+        explain_options = {'analyze': True} if options['analyze'] and connection.vendor == 'postgresql' else {}
+        missing = 0
+        for name, expected, queryset in hot_queries():
+            plan = queryset.explain(**explain_options)
+            if expected in plan:
+                self.stdout.write(self.style.SUCCESS(f"{name:<28} uses {expected}"))
+            else:
+                missing += 1
+                self.stdout.write(self.style.WARNING(f"{name:<28} does not use {expected}"))
+            if options['verbose_plans'] or expected not in plan:
+                self.stdout.write(plan + '\n')
+        if missing:
+            self.stdout.write(self.style.WARNING(
+                f"{missing} queries do not use their index. On small tables a sequential scan is expected; use --seed for a realistic volume."
+            ))
+
+
+def hot_queries():
+    """``(name, expected index, queryset)`` for the filters behind the catalog, dashboards and analytics."""
+    product = Product.objects.order_by('?').first()
+    category = product.category_id if product else 0
+    vendor = product.vendor_id if product else 0
+    price = product.price if product else Decimal('10')
+    customer = Order.objects.values_list('user', flat=True).first() or 0
+    email = VendorRequest.objects.values_list('email', flat=True).first() or ''
+    return [
+        ('products in category', 'product_category_active_idx', Product.objects.filter(category=category, active=True)),
+        ('active products by price', 'product_active_price_idx', Product.objects.filter(active=True, price__gte=price, price__lte=price + 1)),
+        ('best sellers', 'product_best_seller_idx', Product.objects.filter(is_best_seller=True)),
+        ('new arrivals', 'product_new_arrival_idx', Product.objects.filter(is_new_arrival=True).order_by('-created_at')[:20]),
+        ('most visited', 'product_views_idx', Product.objects.order_by('-views')[:5]),
+        ('vendor sales', 'orderitem_product_order_idx', OrderItem.objects.filter(product__vendor=vendor)),
+        ('vendor pending orders', 'orderitem_product_order_idx', Order.objects.filter(items__product__vendor=vendor, status='pending').distinct()),
+        ('customer orders', 'order_user_status_idx', Order.objects.filter(user=customer)),
+        ('vendor requests by email', 'vendorrequest_email_idx', VendorRequest.objects.filter(email=email)),
+        ('recent searches', 'searchquery_timestamp_idx', SearchQuery.objects.order_by('-timestamp')[:100]),
+    ]
+
+
+def seed(count, batch_size=1000):
+    """Insert ``count`` products with a realistic spread of flags, plus orders, search logs and vendor requests."""
+    rng = random.Random(0)
+    tag = uuid.uuid4().hex[:8]
+    now = timezone.now()
+
+    def users(prefix, number, role):
+        return User.objects.bulk_create(
+            [
+                User(username=f'{prefix}-{tag}-{i}', email=f'{prefix}-{tag}-{i}@example.com', role=role)
+                for i in range(number)
+            ],
+            batch_size=batch_size,
+        )
+
+    vendors = users('vendor', max(1, count // 200), 'vendor')
+    customers = users('customer', max(1, count // 10), 'customer')
+    categories = Category.objects.bulk_create([Category(name=f'category-{tag}-{i}') for i in range(50)])
+
+    products = Product.objects.bulk_create(
+        [
+            Product(
+                vendor=rng.choice(vendors),
+                category=rng.choice(categories),
+                title=f'Product {i}',
+                description='',
+                price=Decimal(rng.randrange(100, 100000)) / 100,
+                sku=f'{tag}-{i}',
+                created_at=now - timezone.timedelta(minutes=i),
+                is_best_seller=rng.random() < 0.01,
+                is_new_arrival=rng.random() < 0.05,
+                views=rng.randrange(10000),
+                active=rng.random() < 0.9,
+            )
+            for i in range(count)
+        ],
+        batch_size=batch_size,
+    )
+    orders = Order.objects.bulk_create(
+        [
+            Order(user=rng.choice(customers), status=rng.choice(('pending', 'completed', 'completed', 'canceled')))
+            for _ in range(max(1, count // 2))
+        ],
+        batch_size=batch_size,
+    )
+    OrderItem.objects.bulk_create(
+        [
+            OrderItem(order=order, product=product, price=product.price)
+            for order in orders for product in rng.sample(products, min(2, len(products)))
+        ],
+        batch_size=batch_size,
+    )
+    SearchQuery.objects.bulk_create(
+        [SearchQuery(user=rng.choice(customers), query=f'query {i}') for i in range(count)],
+        batch_size=batch_size,
+    )
+    VendorRequest.objects.bulk_create(
+        [VendorRequest(business_name=f'Business {i}', email=f'request-{tag}-{i}@example.com') for i in range(max(1, count // 20))],
+        batch_size=batch_size,
+    )
@@ -0,0 +1,182 @@
+import json
+import logging
+import os
+import queue
+import selectors
+import socket
+import threading
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from shop.retriever import retriever
+
+logger = logging.getLogger(__name__)
+
+
+def dispatch(request):
+    op = request.get('op')
+    if op == 'search':
+        return retriever.retrieve_ids(
+            request['query'], int(request['top_k']), request.get('filters'), request.get('mode'),
+        )
+    if op == 'notify':
+        retriever.notify_changed()
+        return None
+    if op == 'status':
+        return retriever.status()
+    raise ValueError(f"Unknown operation {op!r}")
+
+
+class RetrieverServer:
+    """
+    Reads request lines from every client connection on one thread and runs
+    each request on a fixed pool of worker threads, so an idle connection holds
+    no thread and a worker's database connection serves every client. Requests
+    queue up to ``threads`` deep; beyond that the reading thread waits for a
+    worker to free up. A connection is not read again until its response is
+    written, so responses go back in request order.
+    """
+
+    def __init__(self, path, threads):
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(path)
+        self.listener.listen(128)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.listener, selectors.EVENT_READ)
+        self.requests = queue.Queue(maxsize=threads)
+        self.answered = queue.SimpleQueue()
+        self.buffers = {}
+        self._wakeup, self._notify = socket.socketpair()
+        self.selector.register(self._wakeup, selectors.EVENT_READ)
+        self._stopped = threading.Event()
+        self.workers = [
+            threading.Thread(target=self.work, name=f'retriever-service-{i}', daemon=True) for i in range(threads)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server_close()
+
+    def serve_forever(self):
+        while not self._stopped.is_set():
+            for key, events in self.selector.select():
+                if key.fileobj is self.listener:
+                    connection, address = self.listener.accept()
+                    # Clients give up after this long anyway; a worker must not wait on one that stopped reading
+                    connection.settimeout(settings.RETRIEVER_SERVICE_TIMEOUT)
+                    self.buffers[connection] = b''
+                    self.selector.register(connection, selectors.EVENT_READ)
+                elif key.fileobj is self._wakeup:
+                    self._wakeup.recv(4096)
+                    self.resume_answered()
+                else:
+                    self.read(key.fileobj)
+
+    def shutdown(self):
+        self._stopped.set()
+        self._notify.send(b'\0')
+
+    def server_close(self):
+        for worker in self.workers:
+            self.requests.put(None)
+        for worker in self.workers:
+            worker.join()
+        for connection in list(self.buffers):
+            self.close(connection)
+        self.selector.close()
+        self.listener.close()
+        self._wakeup.close()
+        self._notify.close()
+
+    def read(self, connection):
+        try:
+            data = connection.recv(65536)
+        except OSError:
+            data = b''
+        if not data:
+            self.close(connection)
+            return
+        self.buffers[connection] += data
+        self.submit_next(connection)
+
+    def submit_next(self, connection):
+        """Hand the connection's next complete request line to a worker, if it has one."""
+        line, newline, rest = self.buffers[connection].partition(b'\n')
+        if not newline:
+            return False
+        self.buffers[connection] = rest
+        self.selector.unregister(connection)
+        self.requests.put((connection, line))
+        return True
+
+    def resume_answered(self):
+        while True:
+            try:
+                connection, written = self.answered.get_nowait()
+            except queue.Empty:
+                return
+            if not written:
+                self.close(connection, registered=False)
+            elif not self.submit_next(connection):
+                self.selector.register(connection, selectors.EVENT_READ)
+
+    def close(self, connection, registered=True):
+        if registered and connection in self.buffers:
+            try:
+                self.selector.unregister(connection)
+            except KeyError:
+                pass
+        self.buffers.pop(connection, None)
+        connection.close()
+
+    def work(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                return
+            connection, line = request
+            try:
+                response = {'ok': True, 'result': dispatch(json.loads(line))}
+            except Exception as e:
+                logger.exception("Retriever service request failed")
+                response = {'ok': False, 'error': str(e)}
+                # The database connection is kept across requests; drop it if it is what failed
+                close_old_connections()
+            try:
+                connection.sendall(json.dumps(response).encode() + b'\n')
+                written = True
+            except OSError:
+                written = False
+            self.answered.put((connection, written))
+            self._notify.send(b'\0')
+
+
+class Command(BaseCommand):
+    help = 'Serve product search for all workers from one process over a Unix socket'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', default=None, help='Defaults to RETRIEVER_SERVICE_SOCKET')
+        parser.add_argument('--threads', type=int, default=None, help='Defaults to RETRIEVER_SERVICE_THREADS')
+        parser.add_argument('--query-batch-size', type=int, default=None, help='Defaults to RETRIEVER_SERVICE_QUERY_BATCH_SIZE')
+
+    def handle(self, *args, **options):
+        path = options['socket'] or settings.RETRIEVER_SERVICE_SOCKET
+        if not path:
+            self.stdout.write(self.style.ERROR('No socket path given. Set RETRIEVER_SERVICE_SOCKET or pass --socket.'))
+            return
+
+        # Searches from all workers arrive here concurrently, so batching them pays off
+        retriever.configure_batching(options['query_batch_size'] or settings.RETRIEVER_SERVICE_QUERY_BATCH_SIZE)
+        # Load everything before accepting connections, so clients never wait on it
+        retriever.load()
+
+        if os.path.exists(path):
+            os.unlink(path)
+        with RetrieverServer(path, options['threads'] or settings.RETRIEVER_SERVICE_THREADS) as server:
+            os.chmod(path, 0o660)
+            self.stdout.write(self.style.SUCCESS(f'Retriever service listening on {path}'))
+            server.serve_forever()
@@ -0,0 +1,109 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:50
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Built and dropped with CONCURRENTLY, so writes to these tables are never blocked while it runs;
+# the database side is therefore PostgreSQL only.
+CREATE_INDEXES = [
+    ('order_user_status_idx', 'shop_order ("user_id", "status")'),
+    ('orderitem_product_order_idx', 'shop_orderitem ("product_id", "order_id")'),
+    ('product_category_active_idx', 'shop_product ("category_id", "active")'),
+    ('product_active_price_idx', 'shop_product ("price") WHERE "active"'),
+    ('product_best_seller_idx', 'shop_product ("id") WHERE "is_best_seller"'),
+    ('product_new_arrival_idx', 'shop_product ("created_at" DESC) WHERE "is_new_arrival"'),
+    ('product_views_idx', 'shop_product ("views" DESC)'),
+    ('searchquery_timestamp_idx', 'shop_searchquery ("timestamp" DESC)'),
+    ('vendorrequest_email_idx', 'shop_vendorrequest ("email")'),
+]
+
+# The single-column foreign key indexes the composite ones above make redundant, under the names Django gave them
+DROP_INDEXES = [
+    ('shop_order_user_id_00aba627', 'shop_order ("user_id")'),
+    ('shop_orderitem_product_id_48153f22', 'shop_orderitem ("product_id")'),
+    ('shop_product_category_id_14d7eea8', 'shop_product ("category_id")'),
+]
+
+
+def create_index(name, definition):
+    return migrations.RunSQL(
+        f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{name}" ON {definition}',
+        f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"',
+    )
+
+
+def drop_index(name, definition):
+    return migrations.RunSQL(
+        f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"',
+        f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{name}" ON {definition}',
+    )
+
+
+class Migration(migrations.Migration):
+    # Concurrent index builds cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('shop', '0028_remove_product_image'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='order',
+                    index=models.Index(fields=['user', 'status'], name='order_user_status_idx'),
+                ),
+                migrations.AddIndex(
+                    model_name='orderitem',
+                    index=models.Index(fields=['product', 'order'], name='orderitem_product_order_idx'),
+                ),
+                migrations.AddIndex(
+                    model_name='product',
+                    index=models.Index(fields=['category', 'active'], name='product_category_active_idx'),
+                ),
+                migrations.AddIndex(
+                    model_name='product',
+                    index=models.Index(condition=models.Q(('active', True)), fields=['price'], name='product_active_price_idx'),
+                ),
+                migrations.AddIndex(
+                    model_name='product',
+                    index=models.Index(condition=models.Q(('is_best_seller', True)), fields=['id'], name='product_best_seller_idx'),
+                ),
+                migrations.AddIndex(
+                    model_name='product',
+                    index=models.Index(condition=models.Q(('is_new_arrival', True)), fields=['-created_at'], name='product_new_arrival_idx'),
+                ),
+                migrations.AddIndex(
+                    model_name='product',
+                    index=models.Index(fields=['-views'], name='product_views_idx'),
+                ),
+                migrations.AddIndex(
+                    model_name='searchquery',
+                    index=models.Index(fields=['-timestamp'], name='searchquery_timestamp_idx'),
+                ),
+                migrations.AddIndex(
+                    model_name='vendorrequest',
+                    index=models.Index(fields=['email'], name='vendorrequest_email_idx'),
+                ),
+                migrations.AlterField(
+                    model_name='order',
+                    name='user',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='orders', to=settings.AUTH_USER_MODEL),
+                ),
+                migrations.AlterField(
+                    model_name='orderitem',
+                    name='product',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='shop.product'),
+                ),
+                migrations.AlterField(
+                    model_name='product',
+                    name='category',
+                    field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='products', to='shop.category'),
+                ),
+            ],
+            # Composite indexes first, so the foreign key columns are never left unindexed
+            database_operations=[create_index(*index) for index in CREATE_INDEXES] + [drop_index(*index) for index in DROP_INDEXES],
+        ),
+    ]
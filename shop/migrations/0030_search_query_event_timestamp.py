@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:54
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0029_hot_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='searchquery',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
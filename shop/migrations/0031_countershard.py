@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:55
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def copy_site_visits(apps, schema_editor):
+    # The single Visit row becomes the first shard of the site visit counter
+    Visit = apps.get_model('shop', 'Visit')
+    CounterShard = apps.get_model('shop', 'CounterShard')
+    visit = Visit.objects.filter(id=1).first()
+    if visit:
+        CounterShard.objects.create(name='site-visits', slot=0, count=visit.count, updated_at=visit.last_visit)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0030_search_query_event_timestamp'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CounterShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('slot', models.PositiveSmallIntegerField()),
+                ('count', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('name', 'slot'), name='countershard_name_slot_uniq')],
+            },
+        ),
+        migrations.RunPython(copy_site_visits, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:22
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0031_countershard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductDeletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_id', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['deleted_at'], name='productdeletion_deleted_idx')],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['updated_at'], name='product_updated_at_idx'),
+        ),
+    ]
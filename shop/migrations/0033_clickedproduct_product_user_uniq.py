@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:29
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_clicks(apps, schema_editor):
+    # Concurrent flushes could create a second row for the same product and user; fold each into the oldest
+    ClickedProduct = apps.get_model('shop', 'ClickedProduct')
+    duplicates = (
+        ClickedProduct.objects
+        .values('product', 'user')
+        .annotate(rows=Count('id'), first=Min('id'), total=Sum('count'))
+        .filter(rows__gt=1)
+    )
+    for duplicate in duplicates:
+        rows = ClickedProduct.objects.filter(product=duplicate['product'], user=duplicate['user'])
+        rows.filter(id=duplicate['first']).update(count=duplicate['total'])
+        rows.exclude(id=duplicate['first']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0032_product_sync_log'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_clicks, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='clickedproduct',
+            constraint=models.UniqueConstraint(fields=('product', 'user'), name='clickedproduct_product_user_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='clickedproduct',
+            constraint=models.UniqueConstraint(condition=models.Q(('user__isnull', True)), fields=('product',), name='clickedproduct_product_anonymous_uniq'),
+        ),
+    ]
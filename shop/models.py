@@ -63,7 +63,8 @@ class Product(models.Model):
     title = models.CharField(max_length=255)
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
-    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, related_name='products')
+    # Lookups by category are served by the (category, active) index
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, related_name='products', db_index=False)
     sku = models.CharField(max_length=100, unique=True)
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
@@ -72,9 +73,32 @@ class Product(models.Model):
     views = models.PositiveIntegerField(default=0)
     active = models.BooleanField(default=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at'], name='product_updated_at_idx'),
+            models.Index(fields=['category', 'active'], name='product_category_active_idx'),
+            models.Index(fields=['price'], condition=models.Q(active=True), name='product_active_price_idx'),
+            models.Index(fields=['id'], condition=models.Q(is_best_seller=True), name='product_best_seller_idx'),
+            models.Index(fields=['-created_at'], condition=models.Q(is_new_arrival=True), name='product_new_arrival_idx'),
+            models.Index(fields=['-views'], name='product_views_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
+class ProductDeletion(models.Model):
+    # Written when a product is deleted, so search workers can drop it without rescanning the catalog
+    product_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['deleted_at'], name='productdeletion_deleted_idx'),
+        ]
+
+    def __str__(self):
+        return f'Product {self.product_id} deleted at {self.deleted_at}'
+
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to='products/')
@@ -112,7 +136,8 @@ class Order(models.Model):
         ('completed', 'Completed'),
         ('canceled', 'Canceled'),
     ]
-    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='orders')
+    # Lookups by user are served by the (user, status) index
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='orders', db_index=False)
     created_at = models.DateTimeField(default=timezone.now)
     billing_address = models.TextField(default='')
     shipping_address = models.TextField(default='')
@@ -120,15 +145,26 @@ class Order(models.Model):
     payment_method = models.CharField(max_length=100, default='')
     total = models.DecimalField(max_digits=10, decimal_places=2, default=0.0)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'status'], name='order_user_status_idx'),
+        ]
+
     def __str__(self):
         return f'Order {self.id} by {self.user.username}'
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
-    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    # Lookups by product are served by the (product, order) index
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, db_index=False)
     quantity = models.PositiveIntegerField(default=1)
     price = models.DecimalField(max_digits=10, decimal_places=2, default=0.0)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'order'], name='orderitem_product_order_idx'),
+        ]
+
     def __str__(self):
         return f'{self.product.title} x {self.quantity}'
 
@@ -194,19 +230,47 @@ class Visit(models.Model):
     count = models.PositiveIntegerField(default=0)
     last_visit = models.DateTimeField(auto_now=True)
 
+class CounterShard(models.Model):
+    name = models.CharField(max_length=50)
+    slot = models.PositiveSmallIntegerField()
+    count = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'slot'], name='countershard_name_slot_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.name}[{self.slot}] = {self.count}'
+
 class ClickedProduct(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, null=True, blank=True)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     count = models.PositiveIntegerField(default=0)
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # One row per product and user, so concurrent click flushes cannot both create it. Anonymous
+        # clicks get their own constraint, since NULL users never conflict in a plain unique index.
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'user'], name='clickedproduct_product_user_uniq'),
+            models.UniqueConstraint(fields=['product'], condition=models.Q(user__isnull=True), name='clickedproduct_product_anonymous_uniq'),
+        ]
+
     def __str__(self):
         return f'{self.product.title} clicked {self.count} times'
 
 class SearchQuery(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, null=True, blank=True)
     query = models.CharField(max_length=255)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the search happened, not when the buffered log entry is written
+    timestamp = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-timestamp'], name='searchquery_timestamp_idx'),
+        ]
 
     def __str__(self):
         return self.query
@@ -239,6 +303,11 @@ class VendorRequest(models.Model):
     activity = models.CharField(max_length=20, choices=ACTIVITY_CHOICES, default='actif')
     created_at = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['email'], name='vendorrequest_email_idx'),
+        ]
+
     def __str__(self):
         return self.business_name
 
@@ -0,0 +1,12 @@
+from rest_framework.pagination import CursorPagination
+
+
+class IdCursorPagination(CursorPagination):
+    """
+    Keyset pagination on the primary key, newest first. Each page is one range
+    scan of the primary key index however deep the client pages, and rows
+    written meanwhile never shift or repeat items between pages.
+    """
+    ordering = '-id'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
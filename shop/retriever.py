@@ -1,54 +1,944 @@
+import hashlib
+import logging
+import math
 import os
-from transformers import DPRContextEncoder, DPRContextEncoderTokenizer, DPRQuestionEncoder, DPRQuestionEncoderTokenizer
-import torch
-import faiss
+import threading
+import time
+import unicodedata
+from datetime import timedelta
+
 import numpy as np
-from .models import ProductDatabase
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import index_store
+from .batching import MicroBatcher, SingleFlight
+from .encoders import encode_texts, load_encoder
+from .lexical import BM25Index, reciprocal_rank_fusion
+from .models import Product, ProductDeletion
+from .retriever_client import RetrieverClient, RetrieverServiceError
+from .search_cache import LRUCache
+from .serializers import ProductSerializer
 
 # Set environment variable to avoid OpenMP error
 os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
 
-# Load DPR context encoder and tokenizer
-context_tokenizer = DPRContextEncoderTokenizer.from_pretrained("facebook/dpr-ctx_encoder-single-nq-base")
-context_encoder = DPRContextEncoder.from_pretrained("facebook/dpr-ctx_encoder-single-nq-base")
-
-# Load DPR question encoder and tokenizer
-question_tokenizer = DPRQuestionEncoderTokenizer.from_pretrained("facebook/dpr-question_encoder-single-nq-base")
-question_encoder = DPRQuestionEncoder.from_pretrained("facebook/dpr-question_encoder-single-nq-base")
-
-# Encode product titles and descriptions
-def encode_products(products):
-    embeddings = []
-    for product in products:
-        text = f"{product.title} {product.description}"
-        inputs = context_tokenizer(text, return_tensors="pt")
-        with torch.no_grad():
-            embedding = context_encoder(**inputs).pooler_output.numpy()
-        embeddings.append(embedding)
-    embeddings = np.vstack(embeddings)
-    return embeddings
-
-# Fetch all products from the database
-products = ProductDatabase.objects.all()
-product_embeddings = encode_products(products)
-
-# Index embeddings with Faiss
-index = faiss.IndexFlatL2(product_embeddings.shape[1])
-index.add(product_embeddings)
-
-def retrieve_products(query, top_k=3):
-    products = list(ProductDatabase.objects.all())
-    top_k = min(top_k, len(products))
-
-    inputs = question_tokenizer(query, return_tensors="pt")
-    with torch.no_grad():
-        query_embedding = question_encoder(**inputs).pooler_output.numpy()
-
-    distances, indices = index.search(query_embedding, top_k)
-
-    results_available = [products[idx] for idx in indices[0] if idx != -1 and idx < len(products)]
-    
-    return results_available
+logger = logging.getLogger(__name__)
+
+CONTEXT_ENCODER_NAME = "facebook/dpr-ctx_encoder-single-nq-base"
+QUESTION_ENCODER_NAME = "facebook/dpr-question_encoder-single-nq-base"
+
+SYNC_SLACK = timedelta(seconds=5)
+
+# Filter id sets and snapshot selections kept per index generation; selections hold
+# a bitmap over the whole snapshot, so only a few are kept.
+FILTER_CACHE_SIZE = 256
+SELECTION_CACHE_SIZE = 16
+
+# Indexes that cannot filter (plain PQ) are searched this many times deeper than the
+# selection's share of the snapshot suggests, deeper again for queries left short.
+FILTER_OVERFETCH = 4
+
+SEARCH_MODES = ('dense', 'hybrid')
+
+# Recorded in every index version; versions over anything else are never served
+INDEX_SOURCE = 'shop.Product'
+
+
+class IndexSnapshot:
+    """
+    One index version: the FAISS index, its position -> primary key map and,
+    for exact re-ranking, the full-precision vectors by position.
+    """
+
+    def __init__(self, index, ids, version=None, built_at=None, embeddings=None):
+        self.index = index
+        self.ids = ids
+        self.embeddings = embeddings
+        self.version = version
+        # When the catalog was read for this version; later edits live in the overlay
+        self.built_at = built_at
+        self._id_set = None
+        self._order = None
+
+    @property
+    def id_set(self):
+        if self._id_set is None:
+            self._id_set = frozenset(self.ids.tolist())
+        return self._id_set
+
+    def positions(self, pks):
+        """Sorted index positions of the primary keys in ``pks`` that this snapshot holds."""
+        if not len(self.ids) or not len(pks):
+            return np.empty(0, dtype="int64")
+        if self._order is None:
+            order = np.argsort(self.ids)
+            self._order = order, np.asarray(self.ids)[order]
+        order, sorted_ids = self._order
+        found = np.minimum(np.searchsorted(sorted_ids, pks), len(sorted_ids) - 1)
+        return np.sort(order[found[sorted_ids[found] == pks]])
+
+
+class SearchFilter:
+    """
+    Which primary keys a search may return: only those in the sorted array
+    ``allowed`` (None for all of them), and none in ``excluded``. ``key``
+    identifies the filter, for cache keys and for batching equal filters together.
+    """
+
+    def __init__(self, key, allowed=None, excluded=frozenset()):
+        self.key = key
+        self.allowed = allowed
+        self.excluded = excluded
+        self._allowed_set = None
+
+    def accepts(self, pk):
+        if pk in self.excluded:
+            return False
+        if self.allowed is None:
+            return True
+        if self._allowed_set is None:
+            self._allowed_set = frozenset(self.allowed.tolist())
+        return pk in self._allowed_set
+
+
+class SnapshotSelection:
+    """
+    The snapshot positions a search may return, as a sorted array and as the
+    bitmap a FAISS selector reads, plus the overlay primary keys it may return.
+    ``positions`` None allows every snapshot vector and ``overlay_ids`` None
+    every overlay one.
+    """
+
+    def __init__(self, ntotal, positions=None, overlay_ids=None):
+        self.positions = positions
+        self.overlay_ids = overlay_ids
+        self.mask = self.bitmap = None
+        if positions is not None:
+            self.mask = np.zeros(ntotal, dtype=bool)
+            self.mask[positions] = True
+            self.bitmap = np.packbits(self.mask, bitorder="little")
+
+
+class IndexOverlay:
+    """
+    Products added, edited or deleted since the snapshot was built, keyed by primary key.
+
+    New vectors go into a small in-memory id-keyed index, and the snapshot
+    vectors of every changed or deleted product are hidden from results.
+    """
+
+    def __init__(self, dimension):
+        import faiss
+
+        self._lock = threading.Lock()
+        self.index = faiss.IndexIDMap2(faiss.IndexFlatL2(dimension))
+        self.ids = frozenset()
+        self.hidden = frozenset()
+        # pk -> updated_at of the revision that was applied, or deletion time
+        self.changed_at = {}
+        # Bumped on every change, so cached results can tell they are stale
+        self.revision = 0
+
+    def upsert(self, ids, embeddings, changed_at):
+        ids = np.asarray(ids, dtype="int64")
+        with self._lock:
+            self.index.remove_ids(ids)
+            self.index.add_with_ids(embeddings, ids)
+            self.ids = self.ids | set(ids.tolist())
+            self.hidden = self.hidden | set(ids.tolist())
+            self.changed_at.update(zip(ids.tolist(), changed_at))
+            self.revision += 1
+
+    def remove(self, ids, changed_at):
+        ids = np.asarray(ids, dtype="int64")
+        with self._lock:
+            self.index.remove_ids(ids)
+            self.ids = self.ids - set(ids.tolist())
+            self.hidden = self.hidden | set(ids.tolist())
+            self.changed_at.update((pk, changed_at) for pk in ids.tolist())
+            self.revision += 1
+
+    def discard_before(self, timestamp):
+        """Drop changes already contained in a snapshot built at ``timestamp``."""
+        with self._lock:
+            stale = [pk for pk, changed_at in self.changed_at.items() if changed_at < timestamp]
+            self.index.remove_ids(np.asarray(stale, dtype="int64"))
+            self.ids = self.ids - set(stale)
+            self.hidden = self.hidden - set(stale)
+            for pk in stale:
+                del self.changed_at[pk]
+            self.revision += 1
+
+    def search(self, embeddings, top_k, ids=None):
+        """Per query, the ``top_k`` nearest ``(distance, pk)`` pairs, only among ``ids`` when given."""
+        import faiss
+
+        with self._lock:
+            k = min(top_k, self.index.ntotal if ids is None else len(ids))
+            if not k:
+                return [[] for _ in range(len(embeddings))]
+            params = None
+            if ids is not None:
+                params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(np.fromiter(ids, dtype="int64", count=len(ids))))
+            distances, ids = self.index.search(embeddings, k, params=params)
+        return [
+            [(distance, pk) for distance, pk in zip(row_distances.tolist(), row_ids.tolist()) if pk != -1]
+            for row_distances, row_ids in zip(distances, ids)
+        ]
+
+
+INDEX_TYPES = ('flat', 'ivf_flat', 'ivf_pq', 'hnsw')
+VECTOR_ENCODINGS = ('float32', 'float16', 'int8', 'pq')
+
+
+def index_factory_string(index_type, count, dimension, encoding=None):
+    """The FAISS factory string for ``index_type`` and vector ``encoding`` sized for ``count`` vectors."""
+    encoding = encoding or settings.RETRIEVER_VECTOR_ENCODING
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown retriever index type {index_type!r}, expected one of {', '.join(INDEX_TYPES)}")
+    if encoding not in VECTOR_ENCODINGS:
+        raise ValueError(f"Unknown retriever vector encoding {encoding!r}, expected one of {', '.join(VECTOR_ENCODINGS)}")
+
+    # FAISS wants 2**nbits training points per PQ codebook, and ~39 per IVF list
+    nbits = max(1, min(8, int(math.log2(max(count, 2)))))
+    codes = {
+        'float32': 'Flat',
+        'float16': 'SQfp16',
+        'int8': 'SQ8',
+        'pq': f'PQ{settings.RETRIEVER_PQ_M}x{nbits}',
+    }
+    if index_type == 'ivf_pq':
+        encoding = 'pq'
+
+    if index_type == 'flat':
+        return codes[encoding]
+    if index_type == 'hnsw':
+        hnsw = f'HNSW{settings.RETRIEVER_HNSW_M}'
+        return hnsw if encoding == 'float32' else f'{hnsw}_{codes[encoding]}'
+    nlist = settings.RETRIEVER_IVF_NLIST or int(4 * math.sqrt(count))
+    nlist = max(1, min(nlist, count // 39))
+    return f'IVF{nlist},{codes[encoding]}'
+
+
+def build_index(embeddings, index_type=None, encoding=None):
+    """
+    Build and train an index over ``embeddings``. ``index_type`` and ``encoding``
+    default to RETRIEVER_INDEX_TYPE and RETRIEVER_VECTOR_ENCODING.
+    """
+    import faiss
+
+    index_type = index_type or settings.RETRIEVER_INDEX_TYPE
+    count, dimension = embeddings.shape
+    index = faiss.index_factory(dimension, index_factory_string(index_type, count, dimension, encoding))
+    if hasattr(index, 'hnsw'):
+        index.hnsw.efConstruction = settings.RETRIEVER_EF_CONSTRUCTION
+    if not index.is_trained:
+        index.train(embeddings)
+    index.add(embeddings)
+    return configure_index(index)
+
+
+def index_memory_bytes(index):
+    import faiss
+
+    return int(faiss.serialize_index(index).nbytes)
+
+
+def exact_rerank(vectors, query, positions, top_k):
+    """
+    Re-score a shortlist of index positions with exact L2 distances against the
+    full-precision ``vectors`` and keep the best ``top_k``.
+    """
+    # Sorted positions keep reads from a memory-mapped file sequential
+    positions = np.sort(positions[positions != -1])
+    distances = ((np.asarray(vectors[positions], dtype="float32") - query) ** 2).sum(axis=1)
+    best = np.argsort(distances)[:top_k]
+    return distances[best], positions[best]
+
+
+def search_parameters(index, selector, k):
+    """
+    SearchParameters restricting a search of ``index`` to ``selector``, keeping its
+    nprobe / efSearch, or None for index types that cannot filter (plain PQ).
+    """
+    import faiss
+
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+    index = faiss.downcast_index(index)
+    if hasattr(index, 'hnsw'):
+        # HNSW walks the graph past filtered-out nodes, so it needs at least k candidates
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=max(index.hnsw.efSearch, k))
+    if isinstance(index, faiss.IndexPQ):
+        return None
+    return faiss.SearchParameters(sel=selector)
+
+
+def overfetch_search(index, embeddings, k, mask):
+    """
+    Per query, ``(distances, positions)`` of the ``k`` nearest positions ``mask``
+    allows, from an index that cannot filter: search a multiple of ``k`` deep,
+    drop what the mask rules out, and search deeper for the queries left short.
+    """
+    allowed = max(int(mask.sum()), 1)
+    fetch = min(index.ntotal, k * FILTER_OVERFETCH * -(-index.ntotal // allowed))
+    results = [None] * len(embeddings)
+    pending = np.arange(len(embeddings))
+    while len(pending):
+        all_distances, all_positions = index.search(np.ascontiguousarray(embeddings[pending]), fetch)
+        short = []
+        for row, row_distances, row_positions in zip(pending, all_distances, all_positions):
+            keep = (row_positions != -1) & mask[np.maximum(row_positions, 0)]
+            if keep.sum() >= k or fetch >= index.ntotal:
+                results[row] = (row_distances[keep][:k], row_positions[keep][:k])
+            else:
+                short.append(row)
+        pending = np.array(short, dtype="int64")
+        fetch = min(index.ntotal, fetch * FILTER_OVERFETCH)
+    return results
+
+
+def configure_index(index, nprobe=None, ef_search=None):
+    """Apply the search-time knobs: nprobe for IVF indexes, efSearch for HNSW."""
+    import faiss
+
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(nprobe or settings.RETRIEVER_NPROBE, ivf.nlist)
+    hnsw = getattr(faiss.downcast_index(index), 'hnsw', None)
+    if hnsw is not None:
+        hnsw.efSearch = ef_search or settings.RETRIEVER_EF_SEARCH
+    return index
+
+
+class Retriever:
+    """
+    DPR encoders plus the FAISS index over Product.
+
+    Nothing is loaded at import time: the models and the index are built on
+    the first search, or ahead of time through warm_up(). The index is read
+    from the current on-disk version written by ``manage.py build_retriever_index``
+    when there is one, and swapped for a newer version as soon as it is published.
+
+    Products written after the index was built are encoded one by one into an
+    overlay by a background sync thread, so edits are searchable within
+    RETRIEVER_SYNC_INTERVAL seconds without re-encoding the catalog.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._reload_lock = threading.Lock()
+        self._ready = threading.Event()
+        self._next_reload_check = 0
+        self._sync_lock = threading.Lock()
+        self._sync_wakeup = threading.Event()
+        self._synced_until = None
+        self.context_encoder = None
+        self.question_encoder = None
+        self.snapshot = None
+        self.overlay = None
+        self.lexical = None
+        # Primary keys of inactive products, kept out of unfiltered searches
+        self.inactive = frozenset()
+        self.stats = {}
+        self.embedding_cache = LRUCache(settings.RETRIEVER_CACHE_SIZE, settings.RETRIEVER_CACHE_TTL)
+        self.result_cache = LRUCache(settings.RETRIEVER_CACHE_SIZE, settings.RETRIEVER_CACHE_TTL)
+        self.filter_cache = LRUCache(FILTER_CACHE_SIZE, settings.RETRIEVER_CACHE_TTL)
+        self.selection_cache = LRUCache(SELECTION_CACHE_SIZE, settings.RETRIEVER_CACHE_TTL)
+        # Identical searches arriving together share one encode and search
+        self.single_flight = SingleFlight()
+        self.batcher = None
+        self.configure_batching(settings.RETRIEVER_QUERY_BATCH_SIZE)
+
+    def configure_batching(self, batch_size):
+        """Search up to ``batch_size`` concurrent queries together; 1 searches each on its own thread."""
+        self.batcher = None
+        if batch_size > 1:
+            self.batcher = MicroBatcher(
+                self._search_batch,
+                batch_size,
+                settings.RETRIEVER_QUERY_BATCH_WAIT_MS / 1000,
+                name="retriever-query-batcher",
+            )
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    @property
+    def version(self):
+        return self.snapshot.version if self.snapshot else None
+
+    @property
+    def generation(self):
+        """Identifies the exact index contents: the snapshot version plus overlay changes."""
+        return (self.version, self.overlay.revision if self.overlay else 0)
+
+    def load(self):
+        if self.ready:
+            return self
+        with self._lock:
+            if self.ready:
+                return self
+            self.load_encoders()
+            snapshot = self._open_current() or self._build_snapshot()
+            self.overlay = IndexOverlay(snapshot.index.d)
+            self.inactive = frozenset(Product.objects.filter(active=False).values_list('pk', flat=True))
+            if settings.RETRIEVER_SEARCH_MODE == 'hybrid':
+                self.lexical = self._build_lexical()
+            self.snapshot = snapshot
+            self._synced_until = snapshot.built_at or timezone.now()
+            self._next_reload_check = time.monotonic() + settings.RETRIEVER_RELOAD_INTERVAL
+            self._ready.set()
+            if settings.RETRIEVER_SYNC_INTERVAL:
+                threading.Thread(target=self._sync_loop, name="retriever-sync", daemon=True).start()
+        return self
+
+    def load_encoders(self):
+        with self._lock:
+            if self.question_encoder is None:
+                self._load_encoders()
+        return self
+
+    def warm_up(self):
+        """Load the retriever in a background thread so startup is not blocked."""
+        thread = threading.Thread(target=self._warm_up, name="retriever-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def reload(self):
+        """Swap in the current on-disk version if it differs from the one being served."""
+        version = index_store.current_version()
+        if not version or version == self.version:
+            return False
+        snapshot = self._open_current()
+        if snapshot is None:
+            return False
+        with self._sync_lock:
+            # A single assignment, so in-flight searches keep using the snapshot they started with
+            self.snapshot = snapshot
+            if snapshot.built_at:
+                self.overlay.discard_before(snapshot.built_at)
+            self.result_cache.clear()
+        logger.info("Retriever switched to index version %s", snapshot.version)
+        return True
+
+    def _maybe_reload(self):
+        if time.monotonic() < self._next_reload_check or not self._reload_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_reload_check = time.monotonic() + settings.RETRIEVER_RELOAD_INTERVAL
+            self.reload()
+        except Exception:
+            logger.exception("Retriever index reload failed")
+        finally:
+            self._reload_lock.release()
+
+    def notify_changed(self):
+        """
+        Called from the product write paths: wake the sync thread so this
+        worker picks the change up immediately instead of at the next interval.
+        """
+        if self.ready:
+            self._sync_wakeup.set()
 
+    def sync(self):
+        """Apply every product added, edited or deleted since the last sync."""
+        with self._sync_lock:
+            started = timezone.now()
+            query = Product.objects.only('id', 'title', 'description', 'sku', 'active', 'updated_at')
+            deletions = ProductDeletion.objects.all()
+            if self._synced_until:
+                # The slack covers rows saved just before a concurrent transaction committed
+                query = query.filter(updated_at__gte=self._synced_until - SYNC_SLACK)
+                deletions = deletions.filter(deleted_at__gte=self._synced_until - SYNC_SLACK)
+            changed = [
+                product for product in query
+                if self.overlay.changed_at.get(product.pk) != product.updated_at
+            ]
+            if changed:
+                # Before the overlay revision moves on, so no generation is cached with the old flags
+                self.inactive = (
+                    self.inactive - {product.pk for product in changed if product.active}
+                ) | {product.pk for product in changed if not product.active}
+                self.overlay.upsert(
+                    [product.pk for product in changed],
+                    self.encode_products(changed),
+                    [product.updated_at for product in changed],
+                )
+                if self.lexical is not None:
+                    for product in changed:
+                        self.lexical.add(product.pk, product_text(product), [product.sku])
 
+            # Deletions leave no product row behind; they are read from the deletion log
+            snapshot, overlay = self.snapshot, self.overlay
+            removed = {
+                pk for pk in deletions.values_list('product_id', flat=True)
+                if pk in overlay.ids or (pk in snapshot.id_set and pk not in overlay.hidden)
+            }
+            if removed:
+                self.inactive = self.inactive - removed
+                self.overlay.remove(sorted(removed), started)
+                if self.lexical is not None:
+                    for pk in removed:
+                        self.lexical.remove(pk)
 
+            self._synced_until = started
+        if changed or removed:
+            logger.info("Retriever synced %d changed and %d deleted products", len(changed), len(removed))
+
+    def _sync_loop(self):
+        while True:
+            self._sync_wakeup.wait(settings.RETRIEVER_SYNC_INTERVAL)
+            self._sync_wakeup.clear()
+            close_old_connections()
+            try:
+                self.sync()
+            except Exception:
+                logger.exception("Retriever sync failed")
+
+    def _warm_up(self):
+        try:
+            self.load()
+        except Exception:
+            logger.exception("Retriever warm-up failed")
+
+    def _load_encoders(self):
+        import torch
+        from transformers import DPRContextEncoder, DPRContextEncoderTokenizerFast, DPRQuestionEncoder, DPRQuestionEncoderTokenizerFast
+
+        if settings.RETRIEVER_TORCH_THREADS:
+            torch.set_num_threads(settings.RETRIEVER_TORCH_THREADS)
+
+        # Load DPR context and question encoders with their tokenizers
+        self.context_encoder = load_encoder(CONTEXT_ENCODER_NAME, DPRContextEncoder, DPRContextEncoderTokenizerFast)
+        self.question_encoder = load_encoder(QUESTION_ENCODER_NAME, DPRQuestionEncoder, DPRQuestionEncoderTokenizerFast)
+
+    def _open_current(self):
+        version = index_store.current_version()
+        if not version:
+            return None
+        index, ids, embeddings, meta = index_store.load(version)
+        if meta.get('source') != INDEX_SOURCE:
+            logger.warning(
+                "Ignoring index version %s, it was not built over products. "
+                "Rebuild it with 'manage.py build_retriever_index'.", version,
+            )
+            return None
+        configure_index(index)
+        built_at = meta.get('built_at')
+        return IndexSnapshot(index, ids, version, parse_datetime(built_at) if built_at else None, embeddings)
+
+    def lexical_index(self):
+        """
+        The BM25 index over the catalog. Workers searching dense only never need
+        it, so unless hybrid is the default mode it is built on the first hybrid search.
+        """
+        if self.lexical is None:
+            # Under the sync lock, so the next sync applies every change the build did not see
+            with self._sync_lock:
+                if self.lexical is None:
+                    self.lexical = self._build_lexical()
+        return self.lexical
+
+    def _build_lexical(self):
+        lexical = BM25Index()
+        for product in Product.objects.only('id', 'title', 'description', 'sku').iterator():
+            lexical.add(product.pk, product_text(product), [product.sku])
+        return lexical
+
+    def _build_snapshot(self):
+        logger.warning(
+            "No index found in %s, encoding the catalog in process. "
+            "Run 'manage.py build_retriever_index' to build it ahead of time.",
+            settings.RETRIEVER_INDEX_DIR,
+        )
+        built_at = timezone.now()
+        # Fetch all products from the database
+        products = list(Product.objects.order_by('pk').only('id', 'title', 'description'))
+        product_embeddings = self.encode_products(products)
+        ids = np.array([product.pk for product in products], dtype="int64")
+        # Keep the vectors, like a published version, for re-ranking and selective filters
+        return IndexSnapshot(build_index(product_embeddings), ids, built_at=built_at, embeddings=product_embeddings)
+
+    # Encode product titles and descriptions
+    def encode_products(self, products, batch_size=None, progress=None):
+        """
+        Encode products in length-sorted, padded batches truncated to the model limit.
+
+        Embeddings are returned in the order of ``products``. ``progress`` is called
+        with ``(done, total)`` after every batch.
+        """
+        batch_size = batch_size or settings.RETRIEVER_BATCH_SIZE
+        texts = [product_text(product) for product in products]
+        started = time.perf_counter()
+        embeddings, items_per_sec = encode_texts(self.context_encoder, texts, batch_size, progress)
+        if texts:
+            self.stats["encode_items_per_sec"] = items_per_sec
+            logger.info(
+                "Encoded %d products in %.1fs (%s items/sec, batch size %d)",
+                len(texts), time.perf_counter() - started, items_per_sec, batch_size,
+            )
+        return embeddings
+
+    @property
+    def encoder_key(self):
+        """Everything besides the text that decides a product's embedding."""
+        return f"{CONTEXT_ENCODER_NAME}|{settings.RETRIEVER_ENCODER_BACKEND}|{self.context_encoder.max_length}"
+
+    def encode_catalog(self, products, batch_size=None, progress=None):
+        """
+        Encode products for a full rebuild, reusing the embeddings stored with the
+        current index version for every product whose text hash is unchanged.
+
+        Returns ``(embeddings, hashes)`` in the order of ``products``.
+        """
+        hashes = content_hashes([product_text(product) for product in products], self.encoder_key)
+        embeddings = np.zeros((len(products), self.context_encoder.dimension), dtype="float32")
+        reused = np.zeros(len(products), dtype=bool)
+
+        version = index_store.current_version()
+        stored = index_store.load_embeddings(version) if version else None
+        if stored is not None and len(stored[0]) and len(products):
+            stored_hashes, stored_embeddings = stored
+            # The hash covers the encoder too, so a model or backend change matches nothing
+            order = np.argsort(stored_hashes)
+            found = np.minimum(np.searchsorted(stored_hashes[order], hashes), len(order) - 1)
+            reused = stored_hashes[order[found]] == hashes
+            if reused.any():
+                embeddings[reused] = stored_embeddings[order[found[reused]]]
+
+        missing = np.flatnonzero(~reused)
+        embeddings[missing] = self.encode_products(
+            [products[i] for i in missing], batch_size=batch_size, progress=progress,
+        )
+        self.stats["reused_embeddings"] = int(reused.sum())
+        logger.info("Reused %d stored embeddings and encoded %d products", reused.sum(), len(missing))
+        return embeddings, hashes
+
+    def encode_query(self, query):
+        return self.encode_queries([query])
+
+    def encode_queries(self, queries):
+        """Encode several queries in one padded forward pass."""
+        return self.question_encoder.encode(queries)
+
+    def search(self, query, top_k):
+        """Return ``(distances, ids)`` where ids are Product primary keys, -1 for no hit."""
+        self.load()
+        self._maybe_reload()
+        return self.search_embeddings(self.query_embedding(query), top_k)
+
+    def query_embedding(self, query):
+        return self.query_embeddings([query])
+
+    def query_embeddings(self, queries):
+        """Embeddings for ``queries``, encoding only those missing from the cache, together."""
+        keys = [normalize_query(query) for query in queries]
+        embeddings = {key: self.embedding_cache.get(key) for key in set(keys)}
+        missing = [key for key, embedding in embeddings.items() if embedding is None]
+        if missing:
+            for key, embedding in zip(missing, self.encode_queries(missing)):
+                embeddings[key] = embedding
+                self.embedding_cache.set(key, embedding)
+        return np.vstack([embeddings[key] for key in keys])
+
+    def retrieve_ids(self, query, top_k, filters=None, mode=None):
+        """
+        Primary keys of the ``top_k`` best hits among the products matching ``filters``
+        (see filter_products), ranked by ``mode`` (one of SEARCH_MODES, defaulting to
+        RETRIEVER_SEARCH_MODE). Served from the result cache when the index did not
+        change; the filter is only resolved to primary keys on a miss.
+        """
+        mode = mode or settings.RETRIEVER_SEARCH_MODE
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode {mode!r}, expected one of {', '.join(SEARCH_MODES)}")
+        self.load()
+        self._maybe_reload()
+        filters = normalize_filters(filters)
+        key = (normalize_query(query), top_k, mode, self.generation, filters)
+        hits = self.result_cache.get(key)
+        if hits is None:
+            hits = self.single_flight.do(key, lambda: self._retrieve_ids(key, query, top_k, filters, mode))
+        return hits
+
+    def resolve_filter(self, filters):
+        """
+        The SearchFilter for normalized ``filters``. Active products only is the
+        retriever's own inactive set; anything else is read from the database
+        once per index generation.
+        """
+        if filters == DEFAULT_FILTERS:
+            return SearchFilter(filters, excluded=self.inactive)
+        key = (self.generation, filters)
+        search_filter = self.filter_cache.get(key)
+        if search_filter is None:
+            allowed = filter_products(dict(filters)).order_by('pk').values_list('pk', flat=True)
+            search_filter = SearchFilter(filters, allowed=np.fromiter(allowed, dtype="int64"))
+            self.filter_cache.set(key, search_filter)
+        return search_filter
+
+    def _retrieve_ids(self, key, query, top_k, filters, mode):
+        search_filter = self.resolve_filter(filters)
+        if mode == 'hybrid':
+            hits = self._hybrid_ids(query, top_k, search_filter)
+        else:
+            hits = self._dense_ids(query, top_k, search_filter)
+        self.result_cache.set(key, hits)
+        return hits
+
+    def _dense_ids(self, query, top_k, search_filter):
+        if self.batcher:
+            return self.batcher.submit((query, top_k, search_filter))
+        return self._search_batch([(query, top_k, search_filter)])[0]
+
+    def _hybrid_ids(self, query, top_k, search_filter):
+        """Fuse the BM25 and dense rankings; a query naming exactly one SKU never reaches the encoder."""
+        index = self.lexical_index()
+        skus = [pk for pk in index.sku_matches(query) if search_filter.accepts(pk)]
+        if len(skus) == 1:
+            lexical = index.search(query, top_k + 1, search_filter.accepts)
+            return (skus + [pk for score, pk in lexical if pk != skus[0]])[:top_k]
+
+        candidates = max(top_k, settings.RETRIEVER_HYBRID_CANDIDATES)
+        lexical = [pk for score, pk in index.search(query, candidates, search_filter.accepts)]
+        dense = self._dense_ids(query, candidates, search_filter)
+        return reciprocal_rank_fusion([skus, lexical, dense], settings.RETRIEVER_RRF_K)[:top_k]
+
+    def _search_batch(self, requests):
+        """
+        Serve ``(query, top_k, search_filter)`` requests with one encoder pass, and
+        one index search per distinct filter.
+        """
+        embeddings = self.query_embeddings([query for query, top_k, search_filter in requests])
+        groups = {}
+        for row, (query, top_k, search_filter) in enumerate(requests):
+            groups.setdefault(search_filter.key, []).append(row)
+
+        results = [None] * len(requests)
+        for rows in groups.values():
+            search_filter = requests[rows[0]][2]
+            distances, ids = self.search_embeddings(
+                embeddings[rows],
+                max(requests[row][1] for row in rows),
+                search_filter.allowed,
+                search_filter.excluded,
+                search_filter.key,
+            )
+            for row, row_ids in zip(rows, ids):
+                results[row] = [pk for pk in row_ids[:requests[row][1]].tolist() if pk != -1]
+        return results
+
+    def cache_stats(self):
+        return {
+            'embeddings': self.embedding_cache.stats(),
+            'results': self.result_cache.stats(),
+            'filters': self.filter_cache.stats(),
+            'selections': self.selection_cache.stats(),
+        }
+
+    def status(self):
+        return {
+            'ready': self.ready,
+            'version': self.version,
+            'lexical': self.lexical.stats() if self.lexical else None,
+            'inactive': len(self.inactive),
+            'cache': self.cache_stats(),
+            'batching': self.batcher.stats() if self.batcher else None,
+            'single_flight': self.single_flight.stats(),
+            **self.stats,
+        }
+
+    def search_embeddings(self, embeddings, top_k, allowed=None, excluded=frozenset(), key=None):
+        """
+        Search the snapshot and the overlay and merge them into one ranking per query.
+
+        ``allowed`` restricts the results to an array of primary keys, and primary
+        keys in ``excluded`` are never returned. Both are applied as a selection
+        inside the index search; given a ``key`` identifying them, that selection
+        is computed once per index generation.
+        """
+        snapshot, overlay = self.snapshot, self.overlay
+        selection = None
+        if key is not None:
+            # The revision is read before the overlay state the selection is built from
+            cache_key = (snapshot.version, overlay.revision, key)
+            selection = self.selection_cache.get(cache_key)
+        if selection is None:
+            selection = snapshot_selection(snapshot, overlay, allowed, excluded)
+            if key is not None:
+                self.selection_cache.set(cache_key, selection)
+
+        distances = np.full((len(embeddings), top_k), np.inf, dtype="float32")
+        ids = np.full((len(embeddings), top_k), -1, dtype="int64")
+        snapshot_hits = self._search_snapshot(snapshot, embeddings, top_k, selection)
+        overlay_hits = overlay.search(embeddings, top_k, selection.overlay_ids)
+
+        for row in range(len(embeddings)):
+            hits = list(overlay_hits[row])
+            row_distances, row_positions = snapshot_hits[row]
+            hits.extend(
+                (distance, int(snapshot.ids[position]))
+                for distance, position in zip(row_distances.tolist(), row_positions.tolist())
+                if position != -1
+            )
+            hits.sort()
+            for column, (distance, pk) in enumerate(hits[:top_k]):
+                distances[row, column] = distance
+                ids[row, column] = pk
+        return distances, ids
+
+    def _search_snapshot(self, snapshot, embeddings, wanted, selection):
+        """
+        Per query, ``(distances, positions)`` of the ``wanted`` nearest snapshot
+        vectors among those ``selection`` allows.
+        """
+        import faiss
+
+        index = snapshot.index
+        positions = selection.positions
+        empty = (np.empty(0, dtype="float32"), np.empty(0, dtype="int64"))
+        if positions is not None and not len(positions):
+            return [empty] * len(embeddings)
+
+        params = None
+        if positions is not None:
+            if snapshot.embeddings is not None and len(positions) <= settings.RETRIEVER_FILTER_EXACT_LIMIT:
+                # Few matches: scanning just their vectors is cheaper than searching around everything else
+                vectors = np.asarray(snapshot.embeddings[positions], dtype="float32")
+                row_distances, found = faiss.knn(embeddings, vectors, min(wanted, len(positions)))
+                return list(zip(row_distances, positions[found]))
+            params = search_parameters(index, faiss.IDSelectorBitmap(selection.bitmap), wanted)
+
+        # Widen the shortlist when compressed vectors are re-ranked exactly
+        rerank = settings.RETRIEVER_RERANK if snapshot.embeddings is not None else 0
+        k = min(wanted * max(rerank, 1), index.ntotal if positions is None else len(positions))
+        if not k:
+            return [empty] * len(embeddings)
+        if positions is not None and params is None:
+            base = overfetch_search(index, embeddings, k, selection.mask)
+            # The shortlist comes from compressed codes; order it exactly when the vectors are stored
+            rerank = rerank or (snapshot.embeddings is not None)
+        else:
+            base = list(zip(*index.search(embeddings, k, params=params)))
+        if rerank:
+            base = [
+                exact_rerank(snapshot.embeddings, embeddings[row], row_positions, wanted)
+                for row, (row_distances, row_positions) in enumerate(base)
+            ]
+        return base
+
+
+retriever = Retriever()
+
+# With RETRIEVER_SERVICE_SOCKET set, searches go to the shared retriever service
+# and this process never loads the models or the index.
+client = None
+if settings.RETRIEVER_SERVICE_SOCKET:
+    client = RetrieverClient(settings.RETRIEVER_SERVICE_SOCKET, settings.RETRIEVER_SERVICE_TIMEOUT)
+
+
+def encode_products(products, batch_size=None, progress=None):
+    return retriever.load_encoders().encode_products(products, batch_size=batch_size, progress=progress)
+
+
+def product_text(product):
+    return f"{product.title} {product.description}"
+
+
+def content_hashes(texts, key=''):
+    """64-bit hashes of ``texts`` salted with ``key``, as an int64 array."""
+    return np.array([
+        int.from_bytes(hashlib.blake2b(f"{key}\0{text}".encode(), digest_size=8).digest(), 'little', signed=True)
+        for text in texts
+    ], dtype="int64")
+
+
+def normalize_query(query):
+    return " ".join(unicodedata.normalize("NFKC", query).lower().split())
+
+
+def filter_products(filters):
+    """
+    Products matching search ``filters``: ``category`` (name), ``vendor`` (username),
+    ``min_price``, ``max_price`` and ``active``, which defaults to True.
+    """
+    products = Product.objects.filter(active=filters.get('active', True))
+    if filters.get('category'):
+        products = products.filter(category__name=filters['category'])
+    if filters.get('vendor'):
+        products = products.filter(vendor__username=filters['vendor'])
+    if filters.get('min_price') is not None:
+        products = products.filter(price__gte=filters['min_price'])
+    if filters.get('max_price') is not None:
+        products = products.filter(price__lte=filters['max_price'])
+    return products
+
+
+def normalize_filters(filters):
+    """Search ``filters`` as a hashable, canonical tuple of items, with ``active`` defaulting to True."""
+    filters = {'active': True, **{name: value for name, value in (filters or {}).items() if value not in (None, '')}}
+    return tuple(sorted((name, str(value) if name != 'active' else bool(value)) for name, value in filters.items()))
+
+
+DEFAULT_FILTERS = normalize_filters(None)
+
+
+def snapshot_selection(snapshot, overlay, allowed=None, excluded=frozenset()):
+    """The SnapshotSelection of what a search restricted to ``allowed`` and skipping ``excluded`` may return."""
+    hidden = overlay.hidden | excluded
+    hidden_positions = snapshot.positions(np.fromiter(hidden, dtype="int64", count=len(hidden)))
+    ntotal = snapshot.index.ntotal
+    if allowed is None:
+        overlay_ids = overlay.ids - excluded if overlay.ids & excluded else None
+        if not len(hidden_positions):
+            return SnapshotSelection(ntotal, overlay_ids=overlay_ids)
+        mask = np.ones(ntotal, dtype=bool)
+        mask[hidden_positions] = False
+        return SnapshotSelection(ntotal, np.flatnonzero(mask), overlay_ids)
+    positions = np.setdiff1d(snapshot.positions(allowed), hidden_positions, assume_unique=True)
+    return SnapshotSelection(ntotal, positions, overlay.ids.intersection(allowed.tolist()) - excluded)
+
+
+def notify_index_changed():
+    if client:
+        try:
+            client.call('notify')
+        except (OSError, ValueError, RetrieverServiceError) as e:
+            logger.warning("Could not notify the retriever service of a product change: %s", e)
+    else:
+        retriever.notify_changed()
+
+
+def retriever_status():
+    if not client:
+        return retriever.status()
+    try:
+        return client.call('status')
+    except (OSError, ValueError, RetrieverServiceError) as e:
+        return {'ready': False, 'error': str(e)}
+
+
+def retrieve_products(query, top_k=3, filters=None, mode=None):
+    if client:
+        try:
+            hits = client.retrieve_ids(query, top_k, filters, mode)
+        except (OSError, ValueError, RetrieverServiceError) as e:
+            # Degrade to a plain text match rather than failing the search
+            logger.warning("Retriever service unavailable, falling back to text search: %s", e)
+            return list(ProductSerializer.setup_eager_loading(filter_products(filters or {})).filter(
+                Q(title__icontains=query) | Q(description__icontains=query) | Q(sku__iexact=query)
+            )[:top_k])
+    else:
+        hits = retriever.retrieve_ids(query, top_k, filters, mode)
+
+    # Only the hits are fetched, then put back in rank order
+    products = ProductSerializer.setup_eager_loading(Product.objects.all()).in_bulk(hits)
+    results_available = [products[pk] for pk in hits if pk in products]
+
+    return results_available
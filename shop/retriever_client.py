@@ -0,0 +1,77 @@
+import json
+import socket
+import threading
+
+
+class RetrieverServiceError(Exception):
+    pass
+
+
+class RetrieverClient:
+    """
+    Talks to the out-of-process retriever started with ``manage.py run_retriever_service``
+    over a Unix socket: one JSON request line out, one JSON response line back.
+
+    Each thread keeps its connection open between calls. A connection the service
+    closed while it was idle is replaced once; any other failure drops it, so the
+    next call starts on a fresh one.
+    """
+
+    def __init__(self, path, timeout):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def call(self, op, **params):
+        request = json.dumps({'op': op, **params}).encode() + b'\n'
+        try:
+            line = self._exchange(request, retry=getattr(self._local, 'connection', None) is not None)
+            if line is None:
+                # The service restarted or dropped the idle connection before this request
+                self.close()
+                line = self._exchange(request, retry=False)
+        except BaseException:
+            self.close()
+            raise
+        if not line:
+            self.close()
+            raise RetrieverServiceError("Retriever service closed the connection")
+        response = json.loads(line)
+        if not response.get('ok'):
+            raise RetrieverServiceError(response.get('error'))
+        return response['result']
+
+    def retrieve_ids(self, query, top_k, filters=None, mode=None):
+        return self.call('search', query=query, top_k=top_k, filters=filters, mode=mode)
+
+    def close(self):
+        """Close this thread's connection, if it has one."""
+        connection = getattr(self._local, 'connection', None)
+        self._local.connection = None
+        if connection is not None:
+            sock, stream = connection
+            stream.close()
+            sock.close()
+
+    def _exchange(self, request, retry):
+        """Send ``request`` and read the response line, or return None if ``retry`` and the connection was closed."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.settimeout(self.timeout)
+                sock.connect(self.path)
+            except BaseException:
+                sock.close()
+                raise
+            connection = self._local.connection = (sock, sock.makefile('rb'))
+
+        sock, stream = connection
+        try:
+            sock.sendall(request)
+            line = stream.readline()
+        except (BrokenPipeError, ConnectionResetError):
+            if not retry:
+                raise
+            return None
+        return line if line or not retry else None
@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from django.db.models import Prefetch
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
 
@@ -118,6 +119,13 @@ class ProductSerializer(serializers.ModelSerializer):
             'views', 'active', 'images', 'uploaded_images'
         ]
 
+    @staticmethod
+    def setup_eager_loading(queryset, prefix=''):
+        """Load the relations rendered here, for products reached from ``queryset`` through ``prefix``."""
+        return queryset.select_related(f'{prefix}category').prefetch_related(
+            f'{prefix}images', f'{prefix}category__subcategories'
+        )
+
     def create(self, validated_data):
         uploaded_images = validated_data.pop('uploaded_images', [])
         product = super().create(validated_data)
@@ -139,6 +147,20 @@ class ProductDatabaseSerializer(serializers.ModelSerializer):
         fields = ['id', 'title', 'description', 'created_at', 'updated_at']
 
 
+class ProductSearchParamsSerializer(serializers.Serializer):
+    category = serializers.CharField(required=False)
+    vendor = serializers.CharField(required=False)
+    min_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    max_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    active = serializers.BooleanField(default=True)
+    mode = serializers.ChoiceField(choices=['dense', 'hybrid'], required=False)
+
+    def validate(self, data):
+        if 'min_price' in data and 'max_price' in data and data['min_price'] > data['max_price']:
+            raise serializers.ValidationError("min_price cannot be greater than max_price.")
+        return data
+
+
 class SubscriberSerializer(serializers.ModelSerializer):
     class Meta:
         model = Subscriber
@@ -193,6 +215,10 @@ class CartItemSerializer(serializers.ModelSerializer):
         model = CartItem
         fields = ['id', 'product', 'quantity', 'price', 'image']
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return ProductSerializer.setup_eager_loading(queryset, 'product__')
+
 class CartSerializer(serializers.ModelSerializer):
     items = CartItemSerializer(many=True)
 
@@ -200,6 +226,12 @@ class CartSerializer(serializers.ModelSerializer):
         model = Cart
         fields = ['id', 'user', 'created_at', 'items']
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.prefetch_related(
+            Prefetch('items', queryset=CartItemSerializer.setup_eager_loading(CartItem.objects.all()))
+        )
+
 class OrderItemSerializer(serializers.ModelSerializer):
     product = ProductSerializer()
 
@@ -207,6 +239,10 @@ class OrderItemSerializer(serializers.ModelSerializer):
         model = OrderItem
         fields = ['id', 'product', 'quantity', 'price']
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return ProductSerializer.setup_eager_loading(queryset, 'product__')
+
 class OrderSerializer(serializers.ModelSerializer):
     items = OrderItemSerializer(many=True)
 
@@ -214,6 +250,12 @@ class OrderSerializer(serializers.ModelSerializer):
         model = Order
         fields = ['id', 'user', 'created_at', 'billing_address', 'shipping_address', 'status', 'payment_method', 'total', 'items']
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.prefetch_related(
+            Prefetch('items', queryset=OrderItemSerializer.setup_eager_loading(OrderItem.objects.all()))
+        )
+
 
 class HelpCategorySerializer(serializers.ModelSerializer):
     class Meta:
@@ -10,4 +10,35 @@
 # def set_new_arrival(sender, instance, created, **kwargs):
 #     if created:
 #         # Schedule the task to run 10 days later
-#         update_new_arrival_status.apply_async((instance.id,), eta=timezone.now() + timedelta(days=10))
\ No newline at end of file
+#         update_new_arrival_status.apply_async((instance.id,), eta=timezone.now() + timedelta(days=10))
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from . import featured
+from .models import Product, ProductDeletion, ProductImage
+from .retriever import notify_index_changed
+
+
+@receiver(post_delete, sender=Product)
+def log_product_deletion(sender, instance, **kwargs):
+    # In the deleting transaction, so the retriever sync sees it exactly when the row is gone
+    ProductDeletion.objects.create(product_id=instance.pk)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def sync_search_index(sender, instance, **kwargs):
+    # Re-encode only this product once the write is committed
+    transaction.on_commit(notify_index_changed)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def invalidate_featured_products(sender, instance, update_fields=None, **kwargs):
+    # View counts alone only reorder most-visited, which its cache lifetime covers
+    if update_fields and set(update_fields) <= {'views'}:
+        return
+    transaction.on_commit(featured.invalidate)
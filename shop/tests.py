@@ -1,3 +1,109 @@
-from django.test import TestCase
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+import faiss
+import numpy as np
+from django.test import SimpleTestCase, override_settings
+
+from .management.commands.run_retriever_service import RetrieverServer
+from .retriever import IndexOverlay, IndexSnapshot, Retriever, exact_rerank
+from .retriever_client import RetrieverClient, RetrieverServiceError
+
+
+@override_settings(RETRIEVER_FILTER_EXACT_LIMIT=1000, RETRIEVER_RERANK=0)
+class CompressedIndexFilterTests(SimpleTestCase):
+    """Filtered searches of an index that cannot filter by itself (plain PQ)."""
+
+    count = 20000
+    top_k = 10
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.embeddings = rng.normal(size=(self.count, 16)).astype('float32')
+        index = faiss.IndexPQ(16, 4, 8)
+        index.train(self.embeddings)
+        index.add(self.embeddings)
+        self.ids = np.arange(1, self.count + 1, dtype='int64')
+        self.retriever = Retriever()
+        self.retriever.snapshot = IndexSnapshot(index, self.ids, embeddings=self.embeddings)
+        self.retriever.overlay = IndexOverlay(16)
+        self.queries = self.embeddings[:5] + 0.01
+
+    def search(self, **selection):
+        with mock.patch('faiss.knn', side_effect=AssertionError('scanned the stored vectors')), \
+                mock.patch('shop.retriever.exact_rerank', wraps=exact_rerank) as rerank:
+            distances, ids = self.retriever.search_embeddings(self.queries, self.top_k, **selection)
+        return ids, rerank
+
+    def test_one_excluded_product_does_not_scan_all_rows(self):
+        ids, rerank = self.search(excluded=frozenset({1}))
+
+        self.assertNotIn(1, ids)
+        self.assertTrue((ids != -1).all())
+        # Only a shortlist from the index is read back at full precision
+        for call in rerank.call_args_list:
+            self.assertLessEqual(len(call.args[2]), self.top_k * 10)
+        # The query next to the excluded vector still finds its other neighbours
+        self.assertIn(2, ids[1])
+
+    def test_selective_filter_only_returns_allowed_products(self):
+        allowed = self.ids[::10]
+        ids, rerank = self.search(allowed=allowed)
+
+        self.assertTrue(np.isin(ids, allowed).all())
+        for call in rerank.call_args_list:
+            self.assertLess(len(call.args[2]), self.count // 10)
+
+
+class RetrieverServiceTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'retriever.sock')
+
+    def serve(self, threads):
+        server = RetrieverServer(self.path, threads)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(thread.join, 5)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def test_more_clients_than_threads(self):
+        self.serve(threads=2)
+        client = RetrieverClient(self.path, timeout=2)
+        errors = []
+
+        def search(request):
+            time.sleep(0.005)
+            return request['query']
+
+        def run(name):
+            try:
+                for i in range(20):
+                    self.assertEqual(client.retrieve_ids(f'{name}-{i}', 3), f'{name}-{i}')
+            except Exception as e:
+                errors.append(e)
+            finally:
+                client.close()
+
+        with mock.patch('shop.management.commands.run_retriever_service.dispatch', side_effect=search):
+            clients = [threading.Thread(target=run, args=(name,)) for name in range(8)]
+            for thread in clients:
+                thread.start()
+            for thread in clients:
+                thread.join()
+        self.assertEqual(errors, [])
+
+    def test_failed_request_keeps_the_connection(self):
+        self.serve(threads=1)
+        client = RetrieverClient(self.path, timeout=2)
+        self.addCleanup(client.close)
+        with mock.patch('shop.management.commands.run_retriever_service.dispatch', side_effect=[ValueError('bad'), 'ok']):
+            with self.assertRaises(RetrieverServiceError):
+                client.call('unknown')
+            self.assertEqual(client.call('status'), 'ok')
@@ -3,7 +3,7 @@ from rest_framework.routers import DefaultRouter
 from .views import (
     AdminDashboardView, CartItemViewSet, CartViewSet, CategoryCreateView, CategoryRetrieveUpdateDestroyView, CategoryViewSet, ClickedProductView, ContactSubmissionView, 
     CustomerDashboardView, FeaturedProductsView, HelpArticleViewSet, HelpCategoryViewSet, LogoutView, OrderViewSet, ProductDatabaseViewSet, ProductSearchView, 
-    ProductViewAllSet, RegisterView, SearchQueryView, 
+    ProductViewAllSet, RegisterView, SearchQueryView, SearchStatusView, 
     SubscriberCreateView, UserDetailView, UserProfileView, 
     UserViewSet, VendorDashboardView, VendorPoliciesGuidelinesViewSet, VendorRequestDetailView, VendorRequestListCreateView, VisitViewSet,
     ProductDetailView, proxy_elasticsearch, ProductViewSet, ProductVariantViewSet, InventoryViewSet, health_check
@@ -50,6 +50,7 @@ urlpatterns = [
     path('subscribe/', SubscriberCreateView.as_view(), name='subscribe'),
     path('clicked-products/', ClickedProductView.as_view(), name='clicked-product'),
     path('search/', ProductSearchView.as_view(), name='product-search'),
+    path('search/status/', SearchStatusView.as_view(), name='search-status'),
     path('products/<int:pk>/', ProductDetailView.as_view(), name='product-detail'),
     path('elasticsearch/<path:path>', proxy_elasticsearch, name='proxy_elasticsearch'),
     path('vendor-requests/', VendorRequestListCreateView.as_view(), name='vendor-requests-list-create'),
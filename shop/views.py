@@ -1,7 +1,6 @@
 from django.shortcuts import render
 from rest_framework import generics
 from rest_framework.permissions import AllowAny
-from django.db import models
 import logging
 from django.db.models import Sum
 from django.contrib.auth import get_user_model
@@ -9,7 +8,7 @@ from django.core.mail import send_mail
 import requests
 from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse
-from .serializers import CartItemSerializer, CartSerializer, ClickedProductSerializer, ContactSubmissionSerializer, HelpArticleSerializer, HelpCategorySerializer, OrderSerializer, ProductDatabaseSerializer, RegisterSerializer, SearchQuerySerializer, SubscriberSerializer, UserProfileSerializer, AddressSerializer, VendorPoliciesGuidelinesSerializer, VendorRequestSerializer, VisitSerializer
+from .serializers import CartItemSerializer, CartSerializer, ClickedProductSerializer, ContactSubmissionSerializer, HelpArticleSerializer, HelpCategorySerializer, OrderSerializer, ProductDatabaseSerializer, ProductSearchParamsSerializer, RegisterSerializer, SearchQuerySerializer, SubscriberSerializer, UserProfileSerializer, AddressSerializer, VendorPoliciesGuidelinesSerializer, VendorRequestSerializer, VisitSerializer
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
@@ -25,7 +24,12 @@ from .models import Product, ProductVariant, Category, Inventory, Order
 from .serializers import ProductSerializer, ProductVariantSerializer, CategorySerializer, InventorySerializer
 from django.conf import settings
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from rest_framework.exceptions import ValidationError
+from .pagination import IdCursorPagination
+from .buffers import product_clicks, product_views, search_queries
+from . import counters
+from .featured import featured_products
 
 
 User = get_user_model()
@@ -122,7 +126,7 @@ class ProductViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
     def get_queryset(self):
-        queryset = super().get_queryset()
+        queryset = ProductSerializer.setup_eager_loading(super().get_queryset())
         user = self.request.user
         category_name = self.request.query_params.get('category', None)
 
@@ -140,10 +144,6 @@ class ProductViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         try:
             product = serializer.save(vendor=self.request.user)
-            ProductDatabase.objects.create(
-                title=product.title,
-                description=product.description
-            )
             for image in self.request.FILES.getlist('uploaded_images'):
                 ProductImage.objects.create(product=product, image=image)
         except Exception as e:
@@ -151,14 +151,7 @@ class ProductViewSet(viewsets.ModelViewSet):
 
     def perform_update(self, serializer):
         try:
-            product = serializer.save()
-            product_db_entry, created = ProductDatabase.objects.get_or_create(
-                title=product.title,
-                defaults={'description': product.description}
-            )
-            if not created:
-                product_db_entry.description = product.description
-                product_db_entry.save()
+            serializer.save()
         except Exception as e:
             raise ValidationError({'detail': str(e)})
 
@@ -177,20 +170,38 @@ class ProductSearchView(APIView):
         if not query:
             return Response({"error": "Query parameter 'q' is required."}, status=400)
 
+        params = ProductSearchParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        # .data holds the validated values in JSON-safe form, for the retriever service
+        filters = dict(params.data)
+        mode = filters.pop('mode', None)
+
         from .retriever import retrieve_products
-        retrieved_products = retrieve_products(query)
-        serializer = ProductDatabaseSerializer(retrieved_products, many=True)
+        retrieved_products = retrieve_products(query, filters=filters, mode=mode)
+        serializer = ProductSerializer(retrieved_products, many=True)
         return Response(serializer.data)
+
+
+class SearchStatusView(APIView):
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        from .retriever import retriever_status
+        details = retriever_status()
+        if request.user.is_staff:
+            return Response(details)
+        # Anyone may probe whether search is up; index and sync details are for staff only
+        return Response({'ready': bool(details.get('ready'))})
     
 
 class ProductViewAllSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Product.objects.all()
+    queryset = ProductSerializer.setup_eager_loading(Product.objects.all())
     serializer_class = ProductSerializer
     permission_classes = [AllowAny]
 
 
 class CategoryViewSet(viewsets.ModelViewSet):
-    queryset = Category.objects.all()
+    queryset = Category.objects.prefetch_related('subcategories')
     serializer_class = CategorySerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
@@ -211,7 +222,7 @@ class ProductVariantViewSet(viewsets.ModelViewSet):
 
 
 class InventoryViewSet(viewsets.ModelViewSet):
-    queryset = Inventory.objects.all()
+    queryset = Inventory.objects.select_related('product')
     serializer_class = InventorySerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
@@ -301,7 +312,7 @@ class CustomerDashboardView(APIView):
 
     def get(self, request):
         customer = request.user
-        orders = Order.objects.filter(user=customer)
+        orders = OrderSerializer.setup_eager_loading(Order.objects.filter(user=customer))
         orders_data = OrderSerializer(orders, many=True).data
         data = {
             'orders': orders_data
@@ -319,43 +330,38 @@ class VisitViewSet(viewsets.ModelViewSet):
     queryset = Visit.objects.all()
     serializer_class = VisitSerializer
 
+    def list(self, request, *args, **kwargs):
+        count, last_visit = counters.total(counters.SITE_VISITS)
+        return Response({'count': count, 'last_visit': last_visit})
+
     def create(self, request, *args, **kwargs):
-        visit, created = Visit.objects.get_or_create(id=1)
-        visit.count += 1
-        visit.save()
-        return Response({'count': visit.count, 'last_visit': visit.last_visit})
+        counters.increment(counters.SITE_VISITS)
+        return self.list(request, *args, **kwargs)
 
 class ClickedProductView(APIView):
     permission_classes = [permissions.AllowAny]
 
     def get(self, request):
         clicked_products = ClickedProduct.objects.select_related('product').all()
-        serializer = ClickedProductSerializer(clicked_products, many=True)
-        return Response(serializer.data)
+        paginator = IdCursorPagination()
+        page = paginator.paginate_queryset(clicked_products, request, view=self)
+        serializer = ClickedProductSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
     def post(self, request):
         product_id = request.data.get('product_id')
         
         if not product_id:
             return Response({"error": "Product ID is required."}, status=status.HTTP_400_BAD_REQUEST)
-        
         try:
-            product = Product.objects.get(id=product_id)
-            user = request.user if request.user.is_authenticated else None
-            clicked_product, created = ClickedProduct.objects.get_or_create(
-                product=product,
-                user=user,
-                defaults={'count': 1}
-            )
-            if not created:
-                clicked_product.count = models.F('count') + 1
-                clicked_product.save(update_fields=['count'])
-                clicked_product.refresh_from_db()
-            return Response({"message": "Product click tracked successfully.", "click_count": clicked_product.count}, status=status.HTTP_201_CREATED)
-        except Product.DoesNotExist:
-            return Response({"error": "Product not found."}, status=status.HTTP_404_NOT_FOUND)
-        except Exception as e:
-            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            product_id = int(product_id)
+        except (TypeError, ValueError):
+            return Response({"error": "Product ID must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Counted in memory and written to ClickedProduct in batches; clicks on unknown products are dropped then
+        user = request.user if request.user.is_authenticated else None
+        product_clicks.add((product_id, user.pk if user else None))
+        return Response({"message": "Product click tracked successfully."}, status=status.HTTP_202_ACCEPTED)
 
 
 class SearchQueryView(APIView):
@@ -364,9 +370,13 @@ class SearchQueryView(APIView):
     def post(self, request):
         user = request.user if request.user.is_authenticated else None
         query = request.data.get('query')
+        if not query:
+            return Response({"error": "Query is required."}, status=status.HTTP_400_BAD_REQUEST)
 
-        SearchQuery.objects.create(user=user, query=query)
-        return Response({"message": "Search query tracked successfully."}, status=status.HTTP_201_CREATED)
+        # Logged in batches behind the request; under overload the entry may be dropped
+        query = str(query)[:SearchQuery._meta.get_field('query').max_length]
+        search_queries.add((user.pk if user else None, query, timezone.now()))
+        return Response({"message": "Search query tracked successfully."}, status=status.HTTP_202_ACCEPTED)
 
 
 # class ProductDetailView(generics.RetrieveAPIView):
@@ -520,7 +530,7 @@ class CartViewSet(viewsets.ModelViewSet):
     serializer_class = CartSerializer
 
     def get_queryset(self):
-        return Cart.objects.filter(user=self.request.user)
+        return CartSerializer.setup_eager_loading(Cart.objects.filter(user=self.request.user))
 
     def create(self, request, *args, **kwargs):
         cart, created = Cart.objects.get_or_create(user=request.user)
@@ -532,7 +542,7 @@ class CartItemViewSet(viewsets.ModelViewSet):
     serializer_class = CartItemSerializer
 
     def get_queryset(self):
-        return CartItem.objects.filter(cart__user=self.request.user)
+        return CartItemSerializer.setup_eager_loading(CartItem.objects.filter(cart__user=self.request.user))
 
     def create(self, request, *args, **kwargs):
         cart, created = Cart.objects.get_or_create(user=request.user)
@@ -557,11 +567,11 @@ class OrderViewSet(viewsets.ModelViewSet):
     serializer_class = OrderSerializer
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user)
+        return OrderSerializer.setup_eager_loading(Order.objects.filter(user=self.request.user))
 
     def create(self, request, *args, **kwargs):
         cart = Cart.objects.get(user=request.user)
-        items = cart.items.all()
+        items = cart.items.select_related('product')
         order = Order.objects.create(
             user=request.user,
             billing_address=request.data.get('billing_address'),
@@ -587,18 +597,8 @@ class FeaturedProductsView(APIView):
     permission_classes = [AllowAny]
 
     def get(self, request):
-        type = request.query_params.get('type')
-        if type == 'best-sellers':
-            products = Product.objects.filter(is_best_seller=True)
-        elif type == 'new-arrivals':
-            products = Product.objects.filter(is_new_arrival=True)
-        elif type == 'most-visited':
-            products = Product.objects.order_by('-views')[:5]
-        else:
-            products = Product.objects.none()
-
-        serializer = ProductSerializer(products, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        # Served from the cache, rebuilt in the background when products change or the entry ages
+        return Response(featured_products(request.query_params.get('type')), status=status.HTTP_200_OK)
     
 
 
@@ -607,9 +607,9 @@ class ProductDetailView(APIView):
 
     def get(self, request, pk):
         try:
-            product = Product.objects.get(pk=pk)
-            product.views += 1
-            product.save()
+            product = ProductSerializer.setup_eager_loading(Product.objects.all()).get(pk=pk)
+            # Counted in memory and written behind, so viewing a product does not write to the database
+            product.views += product_views.add(product.pk)
             serializer = ProductSerializer(product)
             return Response(serializer.data, status=status.HTTP_200_OK)
         except Product.DoesNotExist:
@@ -640,15 +640,17 @@ class HelpArticleViewSet(viewsets.ReadOnlyModelViewSet):
     def by_category(self, request, pk=None):
         category_id = request.query_params.get('category_id')
         articles = HelpArticle.objects.filter(category_id=category_id)
-        serializer = self.get_serializer(articles, many=True)
-        return Response(serializer.data)
+        page = self.paginate_queryset(articles)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
     @action(detail=False, methods=['get'])
     def search(self, request, pk=None):
         query = request.query_params.get('query')
         articles = HelpArticle.objects.filter(title__icontains=query)
-        serializer = self.get_serializer(articles, many=True)
-        return Response(serializer.data)
+        page = self.paginate_queryset(articles)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
     @action(detail=False, methods=['get'])
     def popular(self, request, pk=None):